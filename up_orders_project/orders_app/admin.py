@@ -2,9 +2,163 @@
 from __future__ import unicode_literals
 
 from django.contrib import admin
-from orders_app.models import CustomUser, Store, Item
+from django.contrib.admin.views.main import ChangeList, ORDER_VAR, PAGE_VAR
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 
-# Register your models here.
-admin.site.register(CustomUser)
-admin.site.register(Store)
-admin.site.register(Item)
\ No newline at end of file
+from orders_app import jobs
+from orders_app.models import CustomUser, Store, Item, Job
+
+AFTER_VAR = 'after'
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Uses the database's table statistics instead of ``COUNT(*)`` for
+    unfiltered changelists of large tables. Filtered querysets, and
+    backends without statistics, still get an exact count.
+
+    Keyset pages (see ``KeysetChangeList``) are not counted: only the rows
+    up to one past the page are, to tell whether an older page follows.
+    """
+    exact_below = 10000
+    keyset = False
+
+    @cached_property
+    def count(self):
+        if self.keyset:
+            return self.object_list[:self.per_page + 1].count()
+        query = self.object_list.query
+        if not query.where:
+            estimate = self.estimate(self.object_list.db, query.model._meta.db_table)
+            if estimate is not None and estimate >= self.exact_below:
+                return estimate
+        return super(EstimatedCountPaginator, self).count
+
+    def estimate(self, alias, table):
+        connection = connections[alias]
+        if connection.vendor == 'mysql':
+            sql = ("SELECT TABLE_ROWS FROM information_schema.TABLES "
+                   "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s")
+        elif connection.vendor == 'postgresql':
+            sql = "SELECT reltuples::bigint FROM pg_class WHERE relname = %s"
+        else:
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [table])
+            row = cursor.fetchone()
+        return int(row[0]) if row and row[0] is not None else None
+
+
+class KeysetChangeList(ChangeList):
+    """
+    Adds ``?after=<pk>`` navigation: with the default newest-first ordering
+    the next page is fetched with ``pk < after`` instead of an ``OFFSET``,
+    so deep pages cost the same as the first one.
+    """
+
+    def __init__(self, request, *args, **kwargs):
+        self.keyset_after = None
+        self.keyset_page = False
+        if AFTER_VAR in request.GET:
+            try:
+                self.keyset_after = int(request.GET[AFTER_VAR])
+            except ValueError:
+                pass
+            request.GET = request.GET.copy()
+            del request.GET[AFTER_VAR]
+        super(KeysetChangeList, self).__init__(request, *args, **kwargs)
+
+    def uses_keyset(self):
+        return ORDER_VAR not in self.params and not self.show_all
+
+    def get_queryset(self, request):
+        queryset = super(KeysetChangeList, self).get_queryset(request)
+        if self.keyset_after is not None and self.uses_keyset():
+            queryset = queryset.filter(pk__lt=self.keyset_after)
+            self.keyset_page = request.admin_keyset_page = True
+        return queryset
+
+    def get_results(self, request):
+        super(KeysetChangeList, self).get_results(request)
+        self.result_list = list(self.result_list)
+        if self.keyset_page:
+            # The paginator only counted one row past the page. With the
+            # page size as the count the actions bar offers no "Select all".
+            self.result_count = len(self.result_list)
+        self.keyset_first_url = self.get_query_string(remove=[PAGE_VAR])
+        self.keyset_next_url = None
+        if self.uses_keyset() and len(self.result_list) == self.list_per_page:
+            self.keyset_next_url = self.get_query_string(
+                {AFTER_VAR: self.result_list[-1].pk}, [PAGE_VAR]
+            )
+
+
+class ScalableModelAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    ordering = ('-pk',)
+    list_per_page = 50
+    change_list_template = 'admin/orders_app/keyset_change_list.html'
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        paginator = super(ScalableModelAdmin, self).get_paginator(
+            request, queryset, per_page, orphans, allow_empty_first_page
+        )
+        paginator.keyset = getattr(request, 'admin_keyset_page', False)
+        return paginator
+
+    def response_action(self, request, queryset):
+        # On a keyset page select-across would act on every row older than
+        # ``after``; act on the checked rows only.
+        if getattr(request, 'admin_keyset_page', False) and request.POST.get('select_across') == '1':
+            request.POST = request.POST.copy()
+            request.POST['select_across'] = '0'
+        return super(ScalableModelAdmin, self).response_action(request, queryset)
+
+
+@admin.register(CustomUser)
+class CustomUserAdmin(ScalableModelAdmin):
+    list_display = ('id', 'name', 'role', 'user')
+    list_select_related = ('user',)
+    list_filter = ('role',)
+    raw_id_fields = ('user',)
+    search_fields = ('=user__username',)
+
+
+@admin.register(Store)
+class StoreAdmin(ScalableModelAdmin):
+    list_display = ('id', 'name', 'address', 'merchant')
+    list_select_related = ('merchant',)
+    raw_id_fields = ('merchant',)
+    search_fields = ('^name',)
+
+
+@admin.register(Item)
+class ItemAdmin(ScalableModelAdmin):
+    list_display = ('id', 'name', 'category', 'price', 'store_name')
+    list_select_related = ('store',)
+    list_filter = ('category',)
+    raw_id_fields = ('store',)
+    search_fields = ('^name',)
+
+    def store_name(self, obj):
+        return obj.store.name
+    store_name.short_description = 'store'
+
+
+@admin.register(Job)
+class JobAdmin(ScalableModelAdmin):
+    list_display = ('id', 'name', 'status', 'priority', 'attempts', 'run_at', 'finished_at')
+    list_filter = ('status',)
+    raw_id_fields = ('user',)
+
+    def get_exclude(self, request, obj=None):
+        # Payloads of sensitive jobs hold secrets until the job ends.
+        if obj is not None and jobs.is_sensitive(obj.name):
+            return ('payload',)
+        return super(JobAdmin, self).get_exclude(request, obj)
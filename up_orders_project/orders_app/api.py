@@ -1,9 +1,13 @@
 from tastypie.api import Api
 
-from orders_app.resources import UserResource, CustomUserResource, StoreResource, ItemResource
+from orders_app.resources import (
+    UserResource, CustomUserResource, StoreResource, ItemResource, JobResource, CompositeResource
+)
 
 v1_api = Api(api_name='v1')
 v1_api.register(UserResource())
 v1_api.register(CustomUserResource())
 v1_api.register(StoreResource())
-v1_api.register(ItemResource())
\ No newline at end of file
+v1_api.register(ItemResource())
+v1_api.register(JobResource())
+v1_api.register(CompositeResource())
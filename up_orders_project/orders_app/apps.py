@@ -6,3 +6,6 @@ from django.apps import AppConfig
 
 class OrdersAppConfig(AppConfig):
     name = 'orders_app'
+
+    def ready(self):
+        import orders_app.signals
@@ -0,0 +1,82 @@
+"""
+Shared helpers for the ``bench_*`` management commands.
+"""
+import random
+import time
+
+from orders_app.utils import chunked
+
+# Seeded stores are spread uniformly over this (south, west, north, east) box.
+SEED_AREA = (8.0, 68.0, 35.0, 97.0)
+
+
+def timed(func, repeat=5):
+    """
+    Calls ``func`` ``repeat`` times and returns ``(best_ms, mean_ms, result)``
+    where ``result`` is the return value of the last call.
+    """
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.time()
+        result = func()
+        timings.append((time.time() - start) * 1000)
+    return min(timings), sum(timings) / len(timings), result
+
+
+def seed_catalog(merchants=10, stores_per_merchant=10, items_per_store=10, prefix='bench'):
+    """
+    Bulk inserts ``merchants`` merchant accounts, each with
+    ``stores_per_merchant`` stores of ``items_per_store`` items, and returns
+    the merchants' ``CustomUser`` rows. Usernames start with ``prefix``.
+    Stores get random locations within ``SEED_AREA``.
+    """
+    from django.contrib.auth.models import User
+    from orders_app import geo
+    from orders_app.models import CustomUser, Store, Item
+    from orders_app.signals import rows_updated
+
+    username_prefix = '%s-merchant-' % prefix
+    for chunk in chunked(range(merchants), 500):
+        User.objects.bulk_create([
+            User(username='%s%d' % (username_prefix, i), password='!') for i in chunk
+        ])
+    users = User.objects.filter(username__startswith=username_prefix).iterator()
+    for chunk in chunked(users, 500):
+        CustomUser.objects.bulk_create([
+            CustomUser(user=user, name=user.username, role='Merchant') for user in chunk
+        ])
+    merchant_list = list(CustomUser.objects.filter(user__username__startswith=username_prefix))
+
+    rng = random.Random(prefix)
+    south, west, north, east = SEED_AREA
+
+    def new_store(merchant, i):
+        lat, lng = rng.uniform(south, north), rng.uniform(west, east)
+        return Store(
+            name='Store %d-%d' % (merchant.pk, i), address='%d Main Street' % i,
+            merchant=merchant, owner_id=merchant.user_id,
+            latitude=lat, longitude=lng, grid_cell=geo.grid_cell(lat, lng)
+        )
+
+    stores = (new_store(merchant, i) for merchant in merchant_list for i in range(stores_per_merchant))
+    for chunk in chunked(stores, 1000):
+        Store.objects.bulk_create(chunk)
+
+    categories = [choice[0] for choice in Item.CATEGORY_CHOICES]
+    stores = Store.objects.filter(merchant__in=merchant_list).values_list('id', 'owner_id')
+    items = (
+        Item(
+            name='Item %d-%d' % (store_id, i),
+            category=categories[i % len(categories)],
+            price='%d.%02d' % (i % 500, i % 100),
+            store_id=store_id,
+            owner_id=owner_id
+        )
+        for store_id, owner_id in list(stores)
+        for i in range(items_per_store)
+    )
+    for chunk in chunked(items, 1000):
+        Item.objects.bulk_create(chunk)
+    rows_updated.send(sender=Item, pks=None, store_ids=None)
+    return merchant_list
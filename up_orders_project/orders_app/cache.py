@@ -0,0 +1,303 @@
+"""
+Two-tier, versioned read cache.
+
+A cached value is stored under a key that embeds the current version of
+every scope it was computed from, e.g. ``store:7``. Invalidating a scope
+bumps its version, so every key built from it changes at once and the old
+entries expire unread: nothing has to be found and deleted. The signal
+handlers in ``orders_app.signals`` bump the scopes of the rows that change
+once their transaction commits.
+
+``read_through`` looks a key up in a per-process LRU first, then in the
+shared Django cache, and only then runs the loader. Concurrent misses on
+the same key run the loader once: threads of a process wait for the first
+one, and processes wait on a short lease taken in the shared cache.
+
+Versions are also kept in the process for ``READ_CACHE_LOCAL_TTL`` seconds.
+A bump is seen at once by the process that made it, and by other workers
+within that time.
+
+Versions start from the current time in milliseconds, so a version that
+is evicted and recreated does not bring back entries of an older one.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from orders_app import warmup
+
+# Scopes. The unqualified ones are only bumped when the changed rows are
+# not known.
+STORES = 'stores'
+STORE_LISTS = 'stores:lists'
+ITEMS = 'items'
+ITEM_LISTS = 'items:lists'
+ITEMS_ALL_STORES = 'items:all'
+
+MISSING = object()
+
+
+class LocalCache(object):
+    """
+    Thread-safe LRU of values that expire.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None or entry[0] <= time.time():
+                return default
+            self._data[key] = entry
+            return entry[1]
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (time.time() + timeout, value)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_local = LocalCache(settings.READ_CACHE_LOCAL_SIZE)
+_local_versions = LocalCache(settings.READ_CACHE_LOCAL_SIZE)
+
+
+def clear_local():
+    _local.clear()
+    _local_versions.clear()
+
+
+def _version_key(scope):
+    return 'version:%s' % scope
+
+
+def _new_version():
+    return int(time.time() * 1000)
+
+
+def versions(scopes):
+    """
+    Returns the current version of each scope, in order.
+    """
+    found = dict((scope, _local_versions.get(scope)) for scope in scopes)
+    missing = [scope for scope in scopes if found[scope] is None]
+    if missing:
+        shared = cache.get_many([_version_key(scope) for scope in missing])
+        for scope in missing:
+            version = shared.get(_version_key(scope))
+            if version is None:
+                cache.add(_version_key(scope), _new_version(), None)
+                version = cache.get(_version_key(scope)) or _new_version()
+            _local_versions.set(scope, version, settings.READ_CACHE_LOCAL_TTL)
+            found[scope] = version
+    return [found[scope] for scope in scopes]
+
+
+def bump(*scopes):
+    """
+    Invalidates every value cached under a key built from ``scopes``.
+    """
+    for scope in scopes:
+        try:
+            version = cache.incr(_version_key(scope))
+        except ValueError:
+            version = _new_version()
+            cache.set(_version_key(scope), version, None)
+        _local_versions.set(scope, version, settings.READ_CACHE_LOCAL_TTL)
+
+
+@warmup.register
+def read_cache_versions():
+    # The scopes every list read depends on.
+    versions([STORES, STORE_LISTS, ITEMS, ITEM_LISTS, ITEMS_ALL_STORES])
+
+
+def make_key(prefix, scopes, *parts):
+    """
+    Returns a cache key for ``parts`` under the current versions of
+    ``scopes``. Parts may contain user input; they are hashed.
+    """
+    digest = hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+    return '%s:%s:%s' % (prefix, '.'.join(str(version) for version in versions(scopes)), digest)
+
+
+# Rows are named by their integer id, whatever form it was given in.
+def store_scopes(pk):
+    return [STORES, 'store:%d' % int(pk)]
+
+
+def store_list_scopes():
+    return [STORES, STORE_LISTS]
+
+
+def item_scopes(pk):
+    return [ITEMS, 'item:%d' % int(pk)]
+
+
+def item_list_scopes(store_id=None):
+    return [ITEMS, ITEM_LISTS, ITEMS_ALL_STORES if store_id is None else 'items:store:%s' % int(store_id)]
+
+
+def custom_user_scopes(user_id):
+    return ['custom_user:%d' % int(user_id)]
+
+
+def invalidate_stores(pks):
+    if pks is None:
+        bump(STORES)
+    else:
+        bump(STORE_LISTS, *['store:%d' % int(pk) for pk in set(pks)])
+
+
+def invalidate_items(pks, store_ids):
+    """
+    Drops the cached items ``pks`` and the item lists of ``store_ids``.
+    Either may be None when not known.
+    """
+    if pks is None and store_ids is None:
+        bump(ITEMS)
+        return
+    scopes = ['item:%d' % int(pk) for pk in set(pks or ())]
+    if store_ids is None:
+        scopes.append(ITEM_LISTS)
+    else:
+        scopes.append(ITEMS_ALL_STORES)
+        scopes.extend('items:store:%d' % int(store_id) for store_id in set(store_ids))
+    bump(*scopes)
+
+
+def invalidate_custom_user(user_id):
+    bump(*custom_user_scopes(user_id))
+
+
+class RouteStats(object):
+    """
+    Per-route counts of where reads were served from, and their latency.
+    Counts are per process.
+    """
+    OUTCOMES = ('local', 'shared', 'coalesced', 'miss')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def record(self, route, outcome, ms):
+        with self._lock:
+            stats = self._routes.get(route)
+            if stats is None:
+                stats = self._routes[route] = dict(
+                    [(name, 0) for name in self.OUTCOMES] + [(name + '_ms', 0.0) for name in self.OUTCOMES]
+                )
+            stats[outcome] += 1
+            stats[outcome + '_ms'] += ms
+
+    def snapshot(self):
+        """
+        Returns ``{route: {requests, hit_ratio, <outcome>, <outcome>_mean_ms}}``.
+        Reads served without running the loader count as hits.
+        """
+        with self._lock:
+            routes = dict((route, dict(stats)) for route, stats in self._routes.items())
+        report = {}
+        for route, stats in routes.items():
+            requests = sum(stats[name] for name in self.OUTCOMES)
+            report[route] = {
+                'requests': requests,
+                'hit_ratio': round(1 - float(stats['miss']) / requests, 4) if requests else None,
+            }
+            for name in self.OUTCOMES:
+                report[route][name] = stats[name]
+                report[route][name + '_mean_ms'] = round(stats[name + '_ms'] / stats[name], 3) if stats[name] else None
+        return report
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+
+stats = RouteStats()
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def _wait_shared(key):
+    # Another process holds the lease: poll until it stores the value.
+    deadline = time.time() + settings.READ_CACHE_LOCK_WAIT
+    delay = 0.005
+    while time.time() < deadline:
+        time.sleep(delay)
+        value = cache.get(key, MISSING)
+        if value is not MISSING:
+            return value
+        delay = min(delay * 2, 0.1)
+    return MISSING
+
+
+def _load(key, loader):
+    with _inflight_lock:
+        event = _inflight.get(key)
+        leader = event is None
+        if leader:
+            event = _inflight[key] = threading.Event()
+
+    if not leader:
+        event.wait(settings.READ_CACHE_LOCK_WAIT)
+        value = _local.get(key, MISSING)
+        if value is not MISSING:
+            return value, 'coalesced'
+        # The first load failed or is too slow; load independently.
+        return loader(), 'miss'
+
+    lock_key = 'lock:%s' % key
+    try:
+        if not cache.add(lock_key, 1, settings.READ_CACHE_LOCK_TIMEOUT):
+            value = _wait_shared(key)
+            if value is not MISSING:
+                _local.set(key, value, settings.READ_CACHE_TIMEOUT)
+                return value, 'coalesced'
+        try:
+            value = loader()
+            cache.set(key, value, settings.READ_CACHE_TIMEOUT)
+            _local.set(key, value, settings.READ_CACHE_TIMEOUT)
+        finally:
+            cache.delete(lock_key)
+        return value, 'miss'
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+        event.set()
+
+
+def read_through(route, scopes, parts, loader):
+    """
+    Returns the value cached for ``parts`` of ``route`` under the current
+    versions of ``scopes``, calling ``loader`` to compute it on a miss.
+    Exceptions raised by ``loader`` are not cached.
+    """
+    start = time.time()
+    key = make_key(route, scopes, *parts)
+    value = _local.get(key, MISSING)
+    outcome = 'local'
+    if value is MISSING:
+        value = cache.get(key, MISSING)
+        outcome = 'shared'
+        if value is MISSING:
+            value, outcome = _load(key, loader)
+        else:
+            _local.set(key, value, settings.READ_CACHE_TIMEOUT)
+    stats.record(route, outcome, (time.time() - start) * 1000)
+    return value
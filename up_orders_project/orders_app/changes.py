@@ -0,0 +1,94 @@
+"""
+Change feed for stores and items.
+
+Rows carry an indexed ``updated_at`` and deletions leave a ``Tombstone``.
+A page of changes is every update or deletion after a cursor, in
+``(timestamp, kind, id)`` order, read from the two indexes with one bounded
+query each. The cost of a sync therefore depends on how much changed, not
+on the size of the catalogue.
+
+Timestamps are taken before the writing transaction commits, so a row can
+become visible after a later one has been handed out and the cursor has
+moved past it. Changes are therefore held back ``CHANGE_FEED_DELAY``
+seconds, which must exceed the longest write transaction and the clock
+skew between servers.
+
+Cursors are opaque strings; an empty cursor starts from the beginning.
+"""
+import calendar
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from orders_app.models import Tombstone
+
+UPDATED = 0
+DELETED = 1
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(timestamp, kind, pk):
+    micros = calendar.timegm(timestamp.utctimetuple()) * 10 ** 6 + timestamp.microsecond
+    return '%d.%d.%d' % (micros, kind, pk)
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        micros, kind, pk = [int(part) for part in cursor.split('.')]
+    except ValueError:
+        raise InvalidCursor(cursor)
+    if kind not in (UPDATED, DELETED):
+        raise InvalidCursor(cursor)
+    return EPOCH + timedelta(microseconds=micros), kind, pk
+
+
+def changes_since(queryset, model_name, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Returns ``(updated, deleted_ids, next_cursor, has_more)`` for the rows of
+    ``queryset`` changed after ``cursor``, at most ``limit`` changes.
+    """
+    position = decode_cursor(cursor)
+    horizon = timezone.now() - timedelta(seconds=settings.CHANGE_FEED_DELAY)
+    updated = queryset.filter(updated_at__lte=horizon)
+    deleted = Tombstone.objects.filter(model=model_name, deleted_at__lte=horizon)
+
+    if position is not None:
+        timestamp, kind, pk = position
+        if kind == UPDATED:
+            updated = updated.filter(Q(updated_at__gt=timestamp) | Q(updated_at=timestamp, pk__gt=pk))
+            deleted = deleted.filter(deleted_at__gte=timestamp)
+        else:
+            updated = updated.filter(updated_at__gt=timestamp)
+            deleted = deleted.filter(Q(deleted_at__gt=timestamp) | Q(deleted_at=timestamp, pk__gt=pk))
+
+    events = [
+        (obj.updated_at, UPDATED, obj.pk, obj)
+        for obj in updated.order_by('updated_at', 'pk')[:limit + 1]
+    ] + [
+        (tombstone.deleted_at, DELETED, tombstone.pk, tombstone)
+        for tombstone in deleted.order_by('deleted_at', 'pk')[:limit + 1]
+    ]
+    events.sort(key=lambda event: event[:3])
+
+    has_more = len(events) > limit
+    events = events[:limit]
+    next_cursor = encode_cursor(*events[-1][:3]) if events else cursor
+
+    return (
+        [event[3] for event in events if event[1] == UPDATED],
+        [event[3].object_id for event in events if event[1] == DELETED],
+        next_cursor or '',
+        has_more,
+    )
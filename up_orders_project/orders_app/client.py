@@ -0,0 +1,25 @@
+"""
+Decoder for API responses, for Python consumers of the API.
+
+Usage::
+
+    response = session.get(url, headers={'Accept': MSGPACK_CONTENT_TYPE})
+    data = decode(response.content, response.headers['Content-Type'])
+"""
+import json
+
+from orders_app.columnar import unpack_columns
+
+MSGPACK_CONTENT_TYPE = 'application/x-msgpack'
+
+
+def decode(content, content_type='application/json'):
+    content_type = content_type.split(';')[0].strip()
+    if content_type == MSGPACK_CONTENT_TYPE:
+        import msgpack
+        return unpack_columns(msgpack.unpackb(content, raw=False))
+    if content_type == 'application/json':
+        if isinstance(content, bytes):
+            content = content.decode('utf-8')
+        return json.loads(content)
+    raise ValueError("Unsupported content type '%s'" % content_type)
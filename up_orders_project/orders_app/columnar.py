@@ -0,0 +1,40 @@
+"""
+Columnar packing for list payloads.
+
+A list of dicts that all share the same keys is rewritten as
+``{'__columns__': [...], '__rows__': [[...], ...]}`` so key names are sent
+once per list instead of once per row. Kept free of Django imports so API
+clients can use it directly.
+"""
+
+COLUMNS_KEY = '__columns__'
+ROWS_KEY = '__rows__'
+
+
+def pack_columns(data):
+    if isinstance(data, dict):
+        return dict((key, pack_columns(value)) for key, value in data.items())
+    if isinstance(data, (list, tuple)):
+        if len(data) > 1 and all(isinstance(row, dict) for row in data):
+            columns = sorted(data[0].keys())
+            if all(len(row) == len(columns) and all(key in row for key in columns) for row in data):
+                return {
+                    COLUMNS_KEY: columns,
+                    ROWS_KEY: [[pack_columns(row[key]) for key in columns] for row in data],
+                }
+        return [pack_columns(item) for item in data]
+    return data
+
+
+def unpack_columns(data):
+    if isinstance(data, dict):
+        if COLUMNS_KEY in data and ROWS_KEY in data and len(data) == 2:
+            columns = data[COLUMNS_KEY]
+            return [
+                dict(zip(columns, [unpack_columns(value) for value in row]))
+                for row in data[ROWS_KEY]
+            ]
+        return dict((key, unpack_columns(value)) for key, value in data.items())
+    if isinstance(data, list):
+        return [unpack_columns(item) for item in data]
+    return data
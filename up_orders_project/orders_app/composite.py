@@ -0,0 +1,88 @@
+"""
+Fan-out for composite requests.
+
+``composite/`` authenticates once and then runs each of its parts, which
+are independent reads, on a thread pool shared by the process and bounded
+by ``COMPOSITE_MAX_WORKERS``. Pool threads keep their own database
+connection and recycle it the way request threads do, through
+``close_old_connections`` around every part. With ``COMPOSITE_MAX_WORKERS``
+set to 0 the parts run one after another in the request thread.
+
+Each part reports its own status and time, so one failing part does not
+fail the others. The response carries the wall-clock time of the fan-out.
+Part times overlap and contend for the GIL, so their sum is not what the
+reads cost one after another; ``manage.py bench_composite`` measures that
+by running the same parts inline.
+"""
+import logging
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import six
+from tastypie.exceptions import ImmediateHttpResponse
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPool(settings.COMPOSITE_MAX_WORKERS)
+    return _pool
+
+
+def query_params(params):
+    """
+    Returns JSON ``params`` as the strings a query string would carry.
+    """
+    def text(value):
+        if isinstance(value, bool):
+            return 'true' if value else 'false'
+        if isinstance(value, (list, tuple)):
+            return ','.join(text(item) for item in value)
+        return six.text_type(value)
+    return dict((key, text(value)) for key, value in params.items())
+
+
+def run_part(read):
+    """
+    Calls ``read``, which returns a response body, and returns the part's
+    result: the body with its status and time, or the error.
+    """
+    start = time.time()
+    try:
+        result = dict(read(), status=200)
+    except ImmediateHttpResponse as e:
+        result = {'status': e.response.status_code, 'error': e.response.content.decode('utf-8')}
+    except Exception:
+        logger.exception('Composite part failed')
+        result = {'status': 500, 'error': 'Internal error.'}
+    result['ms'] = round((time.time() - start) * 1000, 3)
+    return result
+
+
+def _run_in_pool(read):
+    close_old_connections()
+    try:
+        return run_part(read)
+    finally:
+        close_old_connections()
+
+
+def fan_out(reads):
+    """
+    Runs ``reads`` concurrently and returns ``(results, wall_ms)``.
+    """
+    start = time.time()
+    if settings.COMPOSITE_MAX_WORKERS and len(reads) > 1:
+        results = get_pool().map(_run_in_pool, reads)
+    else:
+        results = [run_part(read) for read in reads]
+    return results, round((time.time() - start) * 1000, 3)
@@ -0,0 +1,64 @@
+"""
+Facet counts for the item listing.
+
+Counts per category and per price bucket come from one grouped aggregate
+over the filtered items, and are cached per filter scope under the same
+versioned scopes as item listings (see ``orders_app.cache``), so they are
+invalidated whenever the items of their store change.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, When, Value, IntegerField, Count
+
+from orders_app import cache as versioned
+from orders_app.models import Item
+
+# (label, lowest price, price the bucket stops below)
+PRICE_BUCKETS = [
+    ('0-100', 0, 100),
+    ('100-250', 100, 250),
+    ('250-500', 250, 500),
+    ('500-1000', 500, 1000),
+    ('1000+', 1000, None),
+]
+
+
+def count(queryset):
+    """
+    Returns the facet counts of ``queryset`` with a single query.
+    """
+    bucket = Case(
+        *[When(price__lt=high, then=Value(i)) for i, (_, _, high) in enumerate(PRICE_BUCKETS) if high is not None],
+        default=Value(len(PRICE_BUCKETS) - 1),
+        output_field=IntegerField()
+    )
+    rows = queryset.order_by().annotate(bucket=bucket).values('category', 'bucket').annotate(count=Count('id'))
+
+    categories = dict((category, 0) for category, _ in Item.CATEGORY_CHOICES)
+    buckets = [0] * len(PRICE_BUCKETS)
+    for row in rows:
+        categories[row['category']] = categories.get(row['category'], 0) + row['count']
+        buckets[row['bucket']] += row['count']
+
+    return {
+        'category': categories,
+        'price': [
+            {'label': label, 'min': low, 'max': high, 'count': buckets[i]}
+            for i, (label, low, high) in enumerate(PRICE_BUCKETS)
+        ],
+    }
+
+
+def item_facets(queryset, store_id=None, scope=()):
+    """
+    Returns the facet counts of ``queryset``, from the cache when possible.
+    ``scope`` describes the filters that produced ``queryset``; when they
+    limit it to one store, that store is ``store_id``.
+    """
+    key = versioned.make_key('item-facets', versioned.item_list_scopes(store_id), scope)
+    facets = cache.get(key)
+    if facets is None:
+        facets = count(queryset)
+        cache.set(key, facets, settings.FACET_CACHE_TIMEOUT)
+    return facets
+
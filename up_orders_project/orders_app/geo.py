@@ -0,0 +1,102 @@
+"""
+Grid index for nearby store lookups.
+
+The globe is cut into ``CELL_DEGREES`` squares and every located store
+stores the number of its square in the indexed ``Store.grid_cell`` column.
+A radius search reads the stores of the squares covering the circle with
+one query of ``grid_cell BETWEEN`` ranges, then computes exact distances
+for those candidates only. The cost depends on how many stores are near the point,
+not on how many stores there are.
+
+Changing ``CELL_DEGREES`` changes the stored cell numbers; run
+``manage.py import_geocodes --recompute`` after doing so.
+"""
+import math
+
+from django.db.models import Q
+
+EARTH_RADIUS_KM = 6371.0
+CELL_DEGREES = 0.1
+ROWS = int(round(180 / CELL_DEGREES))
+COLUMNS = int(round(360 / CELL_DEGREES))
+
+MAX_RADIUS_KM = 50.0
+
+
+def valid_point(lat, lng):
+    return -90 <= lat <= 90 and -180 <= lng <= 180
+
+
+def _row(lat):
+    return max(0, min(int(math.floor((lat + 90) / CELL_DEGREES)), ROWS - 1))
+
+
+def _column(lng):
+    return int(math.floor((lng + 180) / CELL_DEGREES)) % COLUMNS
+
+
+def grid_cell(lat, lng):
+    """
+    Returns the cell number of a point, or ``None`` for a missing point.
+    """
+    if lat is None or lng is None:
+        return None
+    return _row(lat) * COLUMNS + _column(lng)
+
+
+def cell_ranges(lat, lng, radius_km):
+    """
+    Returns ``(first, last)`` cell number ranges covering every square the
+    circle touches. The squares of one row are numbered consecutively, so
+    a row needs one range, or two where the circle crosses the
+    antimeridian.
+    """
+    angle = radius_km / EARTH_RADIUS_KM
+    delta_lat = math.degrees(angle)
+    first_row, last_row = _row(lat - delta_lat), _row(lat + delta_lat)
+
+    # Widest longitude span of the circle; a circle around a pole spans all.
+    cos_lat = math.cos(math.radians(lat))
+    if math.sin(angle) >= cos_lat:
+        return [(first_row * COLUMNS, (last_row + 1) * COLUMNS - 1)]
+    delta_lng = math.degrees(math.asin(math.sin(angle) / cos_lat))
+    first, last = _column(lng - delta_lng), _column(lng + delta_lng)
+    if first <= last:
+        spans = [(first, last)]
+    else:
+        spans = [(0, last), (first, COLUMNS - 1)]
+
+    return [
+        (row * COLUMNS + low, row * COLUMNS + high)
+        for row in range(first_row, last_row + 1)
+        for low, high in spans
+    ]
+
+
+def distance_km(lat1, lng1, lat2, lng2):
+    """
+    Great-circle distance between two points, by the haversine formula.
+    """
+    lat1, lng1, lat2, lng2 = [math.radians(value) for value in (lat1, lng1, lat2, lng2)]
+    a = (math.sin((lat2 - lat1) / 2) ** 2 +
+         math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def nearby(queryset, lat, lng, radius_km):
+    """
+    Returns ``(distance_km, pk)`` for the stores of ``queryset`` within
+    ``radius_km`` of the point, nearest first.
+    """
+    cells = Q()
+    for first, last in cell_ranges(lat, lng, radius_km):
+        cells |= Q(grid_cell__range=(first, last))
+    candidates = queryset.filter(cells).values_list('pk', 'latitude', 'longitude')
+
+    results = []
+    for pk, store_lat, store_lng in candidates.iterator():
+        distance = distance_km(lat, lng, store_lat, store_lng)
+        if distance <= radius_km:
+            results.append((distance, pk))
+    results.sort()
+    return results
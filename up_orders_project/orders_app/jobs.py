@@ -0,0 +1,204 @@
+"""
+Database backed background jobs.
+
+Heavy write-side work is queued as a ``Job`` row with ``enqueue`` and picked
+up by ``manage.py run_workers``. Workers claim a job with a conditional
+``UPDATE`` on its status so several processes can share one table without
+an external broker. Failed jobs are retried with exponential backoff until
+``max_attempts`` is reached.
+
+Job functions are registered by name::
+
+    @register('purge_store')
+    def purge_store(store_id):
+        ...
+
+While a job runs its worker bumps ``heartbeat_at`` every
+``JOB_HEARTBEAT_INTERVAL`` seconds. Workers periodically put running jobs
+whose heartbeat is older than ``JOB_STALE_AFTER`` back in the queue, as
+their worker died.
+
+The payload of a job registered with ``sensitive=True`` is wiped once the
+job is done or has failed for good.
+"""
+import hashlib
+import json
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import F, Q
+from django.utils import timezone
+
+from orders_app.models import Job
+
+_registry = {}
+_sensitive = set()
+
+
+def register(name, sensitive=False):
+    def decorator(func):
+        _registry[name] = func
+        if sensitive:
+            _sensitive.add(name)
+        return func
+    return decorator
+
+
+def is_sensitive(name):
+    load_tasks()
+    return name in _sensitive
+
+
+def get_setting(name):
+    defaults = {
+        'JOB_POLL_INTERVAL': 1.0,
+        'JOB_RETRY_BACKOFF': 5,
+        'JOB_MAX_BACKOFF': 3600,
+        'JOB_HEARTBEAT_INTERVAL': 15,
+        'JOB_STALE_AFTER': 120,
+    }
+    return getattr(settings, name, defaults[name])
+
+
+def load_tasks():
+    # Registers the job functions; workers call this before claiming jobs.
+    import orders_app.tasks
+
+
+def enqueue(name, payload=None, priority=0, max_attempts=5, user=None, run_at=None):
+    """
+    Queues a job and returns it. If an identical job (same name and payload)
+    is still pending, that job is returned instead of queueing another one.
+    """
+    payload = json.dumps(payload or {}, sort_keys=True, cls=DjangoJSONEncoder)
+    dedupe_key = hashlib.sha1(('%s:%s' % (name, payload)).encode('utf-8')).hexdigest()
+
+    pending = Job.objects.filter(dedupe_key=dedupe_key, status=Job.PENDING).first()
+    if pending:
+        return pending
+
+    now = timezone.now()
+    return Job.objects.create(
+        name=name,
+        payload=payload,
+        dedupe_key=dedupe_key,
+        priority=priority,
+        max_attempts=max_attempts,
+        user=user,
+        run_at=run_at or now,
+        created_at=now,
+    )
+
+
+def claim(batch=10):
+    """
+    Marks the highest priority due job as running and returns it, or
+    ``None`` when nothing is due. Another worker may win the race for a
+    candidate, in which case the next candidate is tried.
+    """
+    now = timezone.now()
+    candidates = Job.objects.filter(
+        status=Job.PENDING, run_at__lte=now
+    ).order_by('-priority', 'run_at', 'id').values_list('id', flat=True)[:batch]
+
+    for job_id in candidates:
+        claimed = Job.objects.filter(pk=job_id, status=Job.PENDING).update(
+            status=Job.RUNNING,
+            started_at=now,
+            heartbeat_at=now,
+            attempts=F('attempts') + 1
+        )
+        if claimed:
+            return Job.objects.get(pk=job_id)
+    return None
+
+
+def heartbeat(job_id, done):
+    """
+    Bumps the heartbeat of a running job until ``done`` is set.
+    """
+    try:
+        while not done.wait(get_setting('JOB_HEARTBEAT_INTERVAL')):
+            Job.objects.filter(pk=job_id, status=Job.RUNNING).update(heartbeat_at=timezone.now())
+    finally:
+        connection.close()
+
+
+def run(job):
+    """
+    Runs a claimed job and records its result, or schedules a retry.
+    """
+    done = threading.Event()
+    beat = threading.Thread(target=heartbeat, args=(job.pk, done))
+    beat.daemon = True
+    beat.start()
+    try:
+        func = _registry[job.name]
+        result = func(**json.loads(job.payload))
+    except Exception:
+        job.error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            delay = min(
+                get_setting('JOB_RETRY_BACKOFF') * 2 ** (job.attempts - 1),
+                get_setting('JOB_MAX_BACKOFF')
+            )
+            job.status = Job.PENDING
+            job.run_at = timezone.now() + timedelta(seconds=delay)
+        else:
+            job.status = Job.FAILED
+            job.finished_at = timezone.now()
+    else:
+        job.status = Job.DONE
+        job.result = json.dumps(result, cls=DjangoJSONEncoder)
+        job.error = None
+        job.finished_at = timezone.now()
+    finally:
+        done.set()
+        beat.join()
+
+    update_fields = ['status', 'result', 'error', 'run_at', 'finished_at']
+    if job.name in _sensitive and job.status != Job.PENDING:
+        job.payload = '{}'
+        update_fields.append('payload')
+    job.save(update_fields=update_fields)
+    return job
+
+
+def requeue_stale():
+    """
+    Returns jobs left running by a worker that died to the queue: those
+    whose heartbeat stopped more than ``JOB_STALE_AFTER`` seconds ago.
+    """
+    cutoff = timezone.now() - timedelta(seconds=get_setting('JOB_STALE_AFTER'))
+    return Job.objects.filter(status=Job.RUNNING).filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff)
+    ).update(status=Job.PENDING)
+
+
+def work(stop_event, burst=False):
+    """
+    Worker loop: claims and runs jobs until ``stop_event`` is set, or until
+    the queue is empty when ``burst`` is set. Stale jobs are requeued every
+    ``JOB_HEARTBEAT_INTERVAL`` seconds.
+    """
+    load_tasks()
+    requeued_at = 0
+    try:
+        while not stop_event.is_set():
+            if time.time() - requeued_at >= get_setting('JOB_HEARTBEAT_INTERVAL'):
+                requeue_stale()
+                requeued_at = time.time()
+            job = claim()
+            if job:
+                run(job)
+            elif burst:
+                break
+            else:
+                time.sleep(get_setting('JOB_POLL_INTERVAL'))
+    finally:
+        connection.close()
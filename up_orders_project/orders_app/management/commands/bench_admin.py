@@ -0,0 +1,51 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from orders_app.bench import timed, seed_catalog
+from orders_app.models import Item
+
+
+class Command(BaseCommand):
+    help = 'Times admin changelist and change form page loads on seeded data.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--merchants', type=int, default=100)
+        parser.add_argument('--stores', type=int, default=10, help='Stores per merchant.')
+        parser.add_argument('--items', type=int, default=100, help='Items per store.')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--no-seed', action='store_true', help='Use the data already in the database.')
+
+    @override_settings(ALLOWED_HOSTS=['*'], DEBUG=False)
+    def handle(self, *args, **options):
+        if not options['no_seed']:
+            seed_catalog(options['merchants'], options['stores'], options['items'], prefix='bench-admin')
+
+        admin_user = User.objects.filter(username='bench-admin').first()
+        if admin_user is None:
+            admin_user = User.objects.create_superuser('bench-admin', 'bench-admin@example.com', 'bench-admin')
+        client = Client()
+        client.force_login(admin_user)
+
+        item = Item.objects.order_by('-pk').first()
+        deep_pk = Item.objects.order_by('-pk').values_list('pk', flat=True)[Item.objects.count() // 2]
+        urls = [
+            '/admin/orders_app/customuser/',
+            '/admin/orders_app/store/',
+            '/admin/orders_app/item/',
+            '/admin/orders_app/item/?q=Item+1',
+            '/admin/orders_app/item/?category__exact=Dessert',
+            '/admin/orders_app/item/?after=%d' % deep_pk,
+            '/admin/orders_app/item/%d/change/' % item.pk,
+        ]
+
+        self.stdout.write('%-50s %8s %10s %10s' % ('url', 'queries', 'best ms', 'mean ms'))
+        for url in urls:
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(url)
+            assert response.status_code == 200, (url, response.status_code)
+            query_count = len(queries)
+            best, mean, _ = timed(lambda: client.get(url), options['repeat'])
+            self.stdout.write('%-50s %8d %10.1f %10.1f' % (url, query_count, best, mean))
@@ -0,0 +1,82 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Loads the WSGI application exactly as a server worker would and serves one
+# request through it, reporting when the worker became ready and when the
+# first response was complete.
+CHILD = r'''
+import io, json, sys, time
+from django.conf import settings
+settings.WARM_UP_ON_START = %(warm_up)r
+from up_orders_project.wsgi import application
+ready = time.time()
+body = %(body)r.encode('utf-8')
+environ = {
+    'REQUEST_METHOD': %(method)r,
+    'PATH_INFO': %(path)r,
+    'QUERY_STRING': '',
+    'CONTENT_TYPE': 'application/json',
+    'CONTENT_LENGTH': str(len(body)),
+    'SERVER_NAME': 'localhost',
+    'SERVER_PORT': '8000',
+    'HTTP_HOST': 'localhost',
+    'wsgi.version': (1, 0),
+    'wsgi.url_scheme': 'http',
+    'wsgi.input': io.BytesIO(body),
+    'wsgi.errors': sys.stderr,
+    'wsgi.multithread': False,
+    'wsgi.multiprocess': True,
+    'wsgi.run_once': False,
+}
+status = []
+for chunk in application(environ, lambda s, headers, exc_info=None: status.append(s)):
+    pass
+served = time.time()
+sys.stdout.write(json.dumps({'ready': ready, 'served': served, 'status': status[0]}))
+'''
+
+
+class Command(BaseCommand):
+    help = 'Measures the time from process start to the first served request, with and without warm-up.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument('--method', default='POST')
+        parser.add_argument('--path', default='/api/v1/user/login/')
+        parser.add_argument('--body', default='{"username": "bench", "password": "bench"}')
+
+    def run_once(self, warm_up, options):
+        code = CHILD % {
+            'warm_up': warm_up,
+            'method': options['method'],
+            'path': options['path'],
+            'body': options['body'],
+        }
+        start = time.time()
+        process = subprocess.Popen(
+            [sys.executable, '-c', code],
+            cwd=settings.BASE_DIR,
+            env=dict(os.environ, PYTHONDONTWRITEBYTECODE='1'),
+            stdout=subprocess.PIPE,
+        )
+        output, _ = process.communicate()
+        if process.returncode:
+            raise CommandError('Worker failed to start.')
+        result = json.loads(output.decode('utf-8'))
+        return (result['ready'] - start) * 1000, (result['served'] - result['ready']) * 1000, result['status']
+
+    def handle(self, *args, **options):
+        self.stdout.write('%-10s %12s %18s %12s  %s' % ('warm-up', 'ready ms', 'first request ms', 'total ms', 'status'))
+        for warm_up in (False, True):
+            runs = [self.run_once(warm_up, options) for _ in range(options['runs'])]
+            ready = sorted(run[0] for run in runs)[len(runs) // 2]
+            served = sorted(run[1] for run in runs)[len(runs) // 2]
+            self.stdout.write('%-10s %12.1f %18.1f %12.1f  %s' % (
+                'on' if warm_up else 'off', ready, served, ready + served, runs[-1][2]
+            ))
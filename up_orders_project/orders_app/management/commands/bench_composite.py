@@ -0,0 +1,85 @@
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.test.utils import override_settings
+
+from orders_app import cache as read_cache
+from orders_app.bench import timed, seed_catalog
+from orders_app.models import CustomUser, Store
+from orders_app.resources import UserResource
+
+
+class Command(BaseCommand):
+    help = ('Times a composite request with its parts run inline and on the thread pool, '
+            'and the same reads as separate requests.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--merchants', type=int, default=20)
+        parser.add_argument('--stores', type=int, default=10, help='Stores per merchant.')
+        parser.add_argument('--items', type=int, default=50, help='Items per store.')
+        parser.add_argument(
+            '--workers', type=int, default=settings.COMPOSITE_MAX_WORKERS or 8, help='Pool threads.'
+        )
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--warm', action='store_true', help='Keep the read caches between calls.')
+        parser.add_argument('--no-seed', action='store_true', help='Use the catalogue seeded by an earlier run.')
+
+    @override_settings(ALLOWED_HOSTS=['*'], DEBUG=False)
+    def handle(self, *args, **options):
+        if options['no_seed']:
+            merchant = CustomUser.objects.filter(user__username__startswith='bench-composite-merchant-').first()
+        else:
+            merchant = seed_catalog(
+                options['merchants'], options['stores'], options['items'], prefix='bench-composite'
+            )[0]
+        store = Store.objects.filter(merchant=merchant).first()
+        token = UserResource().generate_token(user_id=merchant.user_id, role=merchant.role)
+
+        parts = [
+            {'name': 'me', 'type': 'custom_user', 'id': merchant.user_id},
+            {'name': 'store', 'type': 'store', 'id': store.pk},
+            {'name': 'menu', 'type': 'items', 'params': {'store': store.pk}},
+            {'name': 'mine', 'type': 'stores', 'params': {'mine': True}},
+            {'name': 'near', 'type': 'nearby_stores', 'params': {
+                'lat': store.latitude, 'lng': store.longitude, 'radius': 50
+            }},
+        ]
+        separate = [
+            '/api/v1/custom_user/get/%d/' % merchant.user_id,
+            '/api/v1/store/get/%d/' % store.pk,
+            '/api/v1/item/get/many/?store=%d' % store.pk,
+            '/api/v1/store/get/many/?mine=true',
+            '/api/v1/store/nearby/?lat=%s&lng=%s&radius=50' % (store.latitude, store.longitude),
+        ]
+        client = Client(HTTP_AUTHORIZATION=token)
+        body = json.dumps({'parts': parts})
+
+        def reset():
+            if not options['warm']:
+                cache.clear()
+                read_cache.clear_local()
+
+        def composite():
+            reset()
+            response = client.post('/api/v1/composite/', body, content_type='application/json')
+            assert response.status_code == 200, response.content
+
+        def requests():
+            reset()
+            for path in separate:
+                response = client.get(path)
+                assert response.status_code == 200, (path, response.status_code)
+
+        self.stdout.write('%-30s %10s %10s' % ('%d parts' % len(parts), 'best ms', 'mean ms'))
+        runs = [
+            ('separate requests', 0, requests),
+            ('composite, inline', 0, composite),
+            ('composite, %d threads' % options['workers'], options['workers'], composite),
+        ]
+        for label, workers, func in runs:
+            with override_settings(COMPOSITE_MAX_WORKERS=workers):
+                best, mean, _ = timed(func, options['repeat'])
+            self.stdout.write('%-30s %10.1f %10.1f' % (label, best, mean))
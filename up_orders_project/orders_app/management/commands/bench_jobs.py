@@ -0,0 +1,50 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from orders_app import jobs
+from orders_app.models import Job
+
+
+class Command(BaseCommand):
+    help = 'Measures job throughput (jobs/s) and queue latency with noop jobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jobs', type=int, default=1000)
+        parser.add_argument('--threads', type=int, default=4)
+
+    def handle(self, *args, **options):
+        Job.objects.filter(name='noop').delete()
+
+        start = time.time()
+        for i in range(options['jobs']):
+            jobs.enqueue('noop', {'n': i})
+        enqueue_seconds = time.time() - start
+
+        stop_event = threading.Event()
+        workers = [
+            threading.Thread(target=jobs.work, args=(stop_event, True))
+            for _ in range(options['threads'])
+        ]
+        start = time.time()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        run_seconds = time.time() - start
+
+        done = Job.objects.filter(name='noop', status=Job.DONE)
+        latencies = sorted(
+            (started_at - created_at).total_seconds() * 1000
+            for created_at, started_at in done.values_list('created_at', 'started_at')
+        )
+        self.stdout.write('enqueued: %.1f jobs/s' % (options['jobs'] / enqueue_seconds))
+        self.stdout.write('processed: %d jobs, %.1f jobs/s with %d threads' % (
+            len(latencies), len(latencies) / run_seconds, options['threads']
+        ))
+        if latencies:
+            self.stdout.write('queue latency: p50 %.1f ms, p95 %.1f ms' % (
+                latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.95)]
+            ))
+        Job.objects.filter(name='noop').delete()
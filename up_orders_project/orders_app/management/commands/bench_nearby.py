@@ -0,0 +1,41 @@
+import random
+
+from django.core.management.base import BaseCommand
+
+from orders_app import geo
+from orders_app.bench import timed, seed_catalog, SEED_AREA
+from orders_app.models import Store
+
+
+class Command(BaseCommand):
+    help = 'Times nearby store searches as the number of seeded stores grows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scales', default='1000,10000,100000',
+            help='Comma separated store counts to measure at; stores are added between steps.'
+        )
+        parser.add_argument('--radius', type=float, default=10.0, help='Search radius in km.')
+        parser.add_argument('--points', type=int, default=20, help='Random search points per scale.')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        stores_per_merchant = 10
+        south, west, north, east = SEED_AREA
+        rng = random.Random('bench-nearby')
+        points = [(rng.uniform(south, north), rng.uniform(west, east)) for _ in range(options['points'])]
+
+        self.stdout.write('%10s %12s %10s %10s' % ('stores', 'found/search', 'best ms', 'mean ms'))
+        for step, scale in enumerate(int(value) for value in options['scales'].split(',')):
+            missing = scale - Store.objects.count()
+            if missing > 0:
+                merchants = -(-missing // stores_per_merchant)
+                seed_catalog(merchants, stores_per_merchant, 0, prefix='bench-nearby-%d' % step)
+
+            def search():
+                return sum(len(geo.nearby(Store.objects.all(), lat, lng, options['radius'])) for lat, lng in points)
+
+            best, mean, found = timed(search, options['repeat'])
+            self.stdout.write('%10d %12.1f %10.2f %10.2f' % (
+                Store.objects.count(), float(found) / len(points), best / len(points), mean / len(points)
+            ))
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from orders_app.bench import timed, seed_catalog
+from orders_app.models import Store, Item
+
+
+def explain(queryset):
+    """
+    Returns the database's plan for ``queryset`` as a list of lines.
+    """
+    sql, params = queryset.query.sql_with_params()
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql, params)
+        return [' '.join(str(column) for column in row) for row in cursor.fetchall()]
+
+
+class Command(BaseCommand):
+    help = 'Compares query plans and timings of join-based and owner-column ownership checks on seeded data.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--merchants', type=int, default=100)
+        parser.add_argument('--stores', type=int, default=10, help='Stores per merchant.')
+        parser.add_argument('--items', type=int, default=100, help='Items per store.')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--no-seed', action='store_true', help='Use the data already in the database.')
+
+    def handle(self, *args, **options):
+        if not options['no_seed']:
+            seed_catalog(options['merchants'], options['stores'], options['items'], prefix='bench-ownership')
+
+        item = Item.objects.order_by('-pk').first()
+        user_id = item.owner_id
+        checks = [
+            ('store by pk', Store.objects.filter(pk=item.store_id, merchant__user_id=user_id),
+                Store.objects.filter(pk=item.store_id, owner_id=user_id)),
+            ('item by pk', Item.objects.filter(pk=item.pk, store__merchant__user_id=user_id),
+                Item.objects.filter(pk=item.pk, owner_id=user_id)),
+            ('items of owner', Item.objects.filter(store__merchant__user_id=user_id),
+                Item.objects.filter(owner_id=user_id)),
+        ]
+
+        for name, before, after in checks:
+            self.stdout.write('== %s' % name)
+            for label, queryset in (('before', before), ('after', after)):
+                best, mean, _ = timed(lambda: list(queryset.values_list('pk', flat=True)), options['repeat'])
+                self.stdout.write('%s: best %.2f ms, mean %.2f ms' % (label, best, mean))
+                for line in explain(queryset.values_list('pk', flat=True)):
+                    self.stdout.write('    %s' % line)
@@ -0,0 +1,51 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from orders_app.bench import timed
+from orders_app.client import decode
+from orders_app.models import Item
+from orders_app.serializers import CompactSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compares payload size and encode/decode time of JSON and MessagePack for item lists.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        serializer = CompactSerializer()
+        if 'msgpack' not in serializer.formats:
+            raise CommandError('msgpack is not installed.')
+
+        categories = [choice[0] for choice in Item.CATEGORY_CHOICES]
+        data = {
+            'success': True,
+            'data': [
+                {
+                    'id': i,
+                    'name': 'Item %d' % i,
+                    'category': categories[i % len(categories)],
+                    'price': Decimal('%d.%02d' % (i % 500, i % 100)),
+                }
+                for i in range(options['items'])
+            ]
+        }
+
+        variants = [
+            ('json', 'application/json', False),
+            ('msgpack', 'application/x-msgpack', False),
+            ('msgpack+columnar', 'application/x-msgpack', True),
+        ]
+        self.stdout.write('%-18s %12s %12s %12s' % ('format', 'bytes', 'encode ms', 'decode ms'))
+        for label, content_type, columnar in variants:
+            serializer.columnar = columnar
+            encode_ms, _, payload = timed(
+                lambda: serializer.serialize(data, format=content_type), options['repeat']
+            )
+            if not isinstance(payload, bytes):
+                payload = payload.encode('utf-8')
+            decode_ms, _, _ = timed(lambda: decode(payload, content_type), options['repeat'])
+            self.stdout.write('%-18s %12d %12.1f %12.1f' % (label, len(payload), encode_ms, decode_ms))
@@ -0,0 +1,110 @@
+import csv
+import io
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import six, timezone
+
+from orders_app import geo
+from orders_app.models import Store
+from orders_app.signals import rows_updated
+from orders_app.utils import chunked
+
+
+def normalize(address):
+    return ' '.join(address.lower().split())
+
+
+def read_geocodes(path):
+    """
+    Returns ``{normalized address: (latitude, longitude)}`` from a CSV file
+    with ``address``, ``latitude`` and ``longitude`` columns.
+    """
+    if six.PY2:
+        handle = open(path, 'rb')
+    else:
+        handle = io.open(path, newline='', encoding='utf-8')
+    geocodes = {}
+    with handle:
+        for line, row in enumerate(csv.DictReader(handle), 2):
+            try:
+                address = row['address']
+                if six.PY2:
+                    address = address.decode('utf-8')
+                lat, lng = float(row['latitude']), float(row['longitude'])
+            except (KeyError, TypeError, ValueError):
+                raise CommandError('%s:%d: expected address, latitude and longitude' % (path, line))
+            if not geo.valid_point(lat, lng):
+                raise CommandError('%s:%d: invalid location %s, %s' % (path, line, lat, lng))
+            geocodes[normalize(address)] = (lat, lng)
+    return geocodes
+
+
+class Command(BaseCommand):
+    help = 'Sets store locations from a local CSV file of address, latitude, longitude.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', help='CSV file with address, latitude and longitude columns.')
+        parser.add_argument('--overwrite', action='store_true', help='Replace locations already set.')
+        parser.add_argument(
+            '--recompute', action='store_true',
+            help='Recompute the grid cell of every located store, after changing orders_app.geo.CELL_DEGREES.'
+        )
+
+    def handle(self, *args, **options):
+        if options['recompute']:
+            self.stdout.write('%d stores moved to a new grid cell.' % self.recompute())
+        if options['path']:
+            self.import_geocodes(options['path'], options['overwrite'])
+        elif not options['recompute']:
+            raise CommandError('Give a CSV file, or --recompute.')
+
+    def import_geocodes(self, path, overwrite):
+        geocodes = read_geocodes(path)
+
+        stores = Store.objects.exclude(address=None)
+        if not overwrite:
+            stores = stores.filter(latitude=None)
+        ids_by_address = defaultdict(list)
+        unmatched = 0
+        for pk, address in stores.values_list('id', 'address').iterator():
+            key = normalize(address)
+            if key in geocodes:
+                ids_by_address[key].append(pk)
+            else:
+                unmatched += 1
+
+        # Stores at the same address share a location: one UPDATE each.
+        located = 0
+        for addresses in chunked(ids_by_address, 500):
+            updated_ids = []
+            with transaction.atomic():
+                now = timezone.now()
+                for address in addresses:
+                    lat, lng = geocodes[address]
+                    for chunk in chunked(ids_by_address[address], 500):
+                        Store.objects.filter(pk__in=chunk).update(
+                            latitude=lat, longitude=lng, grid_cell=geo.grid_cell(lat, lng), updated_at=now
+                        )
+                        updated_ids.extend(chunk)
+            rows_updated.send(sender=Store, pks=updated_ids, store_ids=updated_ids)
+            located += len(updated_ids)
+
+        self.stdout.write('%d stores located, %d addresses not found in %s.' % (located, unmatched, path))
+
+    def recompute(self):
+        # grid_cell is not part of any API response, so updated_at is left alone.
+        ids_by_cell = defaultdict(list)
+        located = Store.objects.exclude(latitude=None).exclude(longitude=None)
+        for pk, lat, lng, cell in located.values_list('id', 'latitude', 'longitude', 'grid_cell').iterator():
+            new_cell = geo.grid_cell(lat, lng)
+            if new_cell != cell:
+                ids_by_cell[new_cell].append(pk)
+
+        moved = 0
+        with transaction.atomic():
+            for cell, ids in ids_by_cell.items():
+                for chunk in chunked(ids, 500):
+                    moved += Store.objects.filter(pk__in=chunk).update(grid_cell=cell)
+        return moved
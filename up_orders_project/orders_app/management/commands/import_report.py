@@ -0,0 +1,75 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter so every import is cold. Wraps __import__ to
+# record the inclusive time of the first import of each module, then loads
+# the application the same way a WSGI worker does.
+CHILD = r'''
+import json, sys, time
+try:
+    import builtins
+except ImportError:
+    import __builtin__ as builtins
+
+timings = {}
+stack = []
+original_import = builtins.__import__
+default_level = -1 if sys.version_info[0] == 2 else 0
+
+def timed_import(name, globals=None, locals=None, fromlist=(), level=default_level):
+    if name in sys.modules or name in stack:
+        return original_import(name, globals, locals, fromlist, level)
+    stack.append(name)
+    start = time.time()
+    try:
+        return original_import(name, globals, locals, fromlist, level)
+    finally:
+        stack.pop()
+        timings.setdefault(name, ((time.time() - start) * 1000, len(stack)))
+
+builtins.__import__ = timed_import
+start = time.time()
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+total = (time.time() - start) * 1000
+builtins.__import__ = original_import
+sys.stdout.write(json.dumps({'total': total, 'modules': timings}))
+'''
+
+
+class Command(BaseCommand):
+    help = 'Reports the cold import time of each module loaded when a worker starts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=30, help='Number of modules to list.')
+        parser.add_argument('--prefix', default='', help='Only list modules starting with this prefix.')
+
+    def handle(self, *args, **options):
+        process = subprocess.Popen(
+            [sys.executable, '-c', CHILD],
+            cwd=settings.BASE_DIR,
+            env=dict(os.environ, PYTHONDONTWRITEBYTECODE='1'),
+            stdout=subprocess.PIPE,
+        )
+        output, _ = process.communicate()
+        if process.returncode:
+            raise CommandError('Could not load the application.')
+        report = json.loads(output.decode('utf-8'))
+
+        modules = [
+            (name, ms, depth) for name, (ms, depth) in report['modules'].items()
+            if name.startswith(options['prefix'])
+        ]
+        modules.sort(key=lambda module: -module[1])
+
+        self.stdout.write('%-50s %10s %6s' % ('module', 'ms', 'depth'))
+        for name, ms, depth in modules[:options['limit']]:
+            self.stdout.write('%-50s %10.1f %6d' % (name, ms, depth))
+        self.stdout.write('total start-up: %.1f ms' % report['total'])
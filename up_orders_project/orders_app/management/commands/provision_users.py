@@ -0,0 +1,60 @@
+import csv
+import io
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import six
+
+from orders_app import provisioning
+
+
+def read_users(path):
+    """
+    Returns the users in ``path``: a JSON list of objects, or a CSV file
+    with ``username``, ``password``, ``email``, ``role`` and optionally
+    ``name`` columns.
+    """
+    if path.endswith('.json'):
+        with io.open(path, encoding='utf-8') as handle:
+            try:
+                users = json.load(handle)
+            except ValueError as e:
+                raise CommandError('%s: %s' % (path, e))
+        if not isinstance(users, list) or not all(isinstance(user, dict) for user in users):
+            raise CommandError('%s: expected a list of objects' % path)
+        return users
+
+    if six.PY2:
+        handle = open(path, 'rb')
+    else:
+        handle = io.open(path, newline='', encoding='utf-8')
+    with handle:
+        users = list(csv.DictReader(handle))
+    if six.PY2:
+        users = [dict((key, value.decode('utf-8') if value else value) for key, value in user.items()) for user in users]
+    return users
+
+
+class Command(BaseCommand):
+    help = 'Creates users in bulk from a CSV or JSON file and reports the throughput.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or .json file of username, password, email, role and name.')
+        parser.add_argument(
+            '--processes', type=int, default=None,
+            help='Processes that hash passwords. Defaults to PROVISION_PROCESSES, or one per core.'
+        )
+        parser.add_argument('--chunk-size', type=int, default=None, help='Users inserted per transaction.')
+
+    def handle(self, *args, **options):
+        users = read_users(options['path'])
+        report = provisioning.provision(users, processes=options['processes'], chunk_size=options['chunk_size'])
+
+        for skipped in report['skipped']:
+            self.stderr.write('skipped %s: %s' % (skipped['username'], skipped['reason']))
+        self.stdout.write('%d users created, %d skipped in %.2fs: %s users/s' % (
+            report['created'], len(report['skipped']), report['seconds'], report['users_per_second']
+        ))
+        self.stdout.write('check %.2fs, hash %.2fs, insert %.2fs' % (
+            report['check_seconds'], report['hash_seconds'], report['insert_seconds']
+        ))
@@ -0,0 +1,82 @@
+import multiprocessing
+import os
+import signal
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from orders_app import jobs
+
+
+def run_threads(threads, burst):
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+
+    workers = [
+        threading.Thread(target=jobs.work, args=(stop_event, burst))
+        for _ in range(threads)
+    ]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+    try:
+        while any(worker.is_alive() for worker in workers):
+            time.sleep(0.2)
+    except KeyboardInterrupt:
+        stop_event.set()
+        for worker in workers:
+            worker.join()
+
+
+class Command(BaseCommand):
+    help = 'Runs background job workers, see orders_app.jobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=getattr(settings, 'JOB_WORKER_PROCESSES', 1)
+        )
+        parser.add_argument(
+            '--threads', type=int, default=getattr(settings, 'JOB_WORKER_THREADS', 4),
+            help='Worker threads per process.'
+        )
+        parser.add_argument(
+            '--burst', action='store_true', help='Exit once the queue is empty.'
+        )
+
+    def handle(self, *args, **options):
+        requeued = jobs.requeue_stale()
+        if requeued:
+            self.stdout.write('Requeued %d stale jobs.' % requeued)
+
+        self.stdout.write('Starting %d process(es) with %d thread(s) each.' % (
+            options['processes'], options['threads']
+        ))
+        if options['processes'] == 1:
+            run_threads(options['threads'], options['burst'])
+            return
+
+        # Forked children must not share the parent's database sockets.
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(target=run_threads, args=(options['threads'], options['burst']))
+            for _ in range(options['processes'])
+        ]
+        for process in processes:
+            process.start()
+
+        def forward(signum, frame):
+            # Each child stops claiming and finishes its running jobs.
+            for process in processes:
+                if process.is_alive():
+                    os.kill(process.pid, signum)
+        signal.signal(signal.SIGTERM, forward)
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+                process.join()
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-19 17:47
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders_app', '0005_job'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='item',
+            name='name',
+            field=models.CharField(db_index=True, max_length=150),
+        ),
+        migrations.AlterField(
+            model_name='store',
+            name='name',
+            field=models.CharField(db_index=True, max_length=150),
+        ),
+    ]
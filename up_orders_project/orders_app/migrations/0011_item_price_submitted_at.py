@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-19 18:25
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders_app', '0010_store_location'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='price_submitted_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+    ]
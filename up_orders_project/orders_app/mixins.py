@@ -1,7 +1,130 @@
+from django.core.exceptions import ValidationError
+from tastypie.exceptions import ImmediateHttpResponse
+from tastypie.http import HttpBadRequest
+
 from orders_app.models import User, CustomUser
+from orders_app.changes import changes_since, InvalidCursor, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 
 class CustomUserMixin:
     def get_custom_user(self, username):
         user = User.objects.get(username=username)
         custom_user = CustomUser.objects.get(user=user)
-        return custom_user
\ No newline at end of file
+        return custom_user
+
+class ChangeFeedMixin:
+    """
+    Adds a ``<resource>/changes/?since=<cursor>`` view, see orders_app.changes.
+    """
+    def get_changes(self, request, **kwargs):
+        self.method_check(request, ['get'])
+        self.is_authenticated(request)
+
+        try:
+            limit = int(request.GET.get('limit', DEFAULT_PAGE_SIZE))
+        except ValueError:
+            raise ImmediateHttpResponse(response=HttpBadRequest("Invalid limit."))
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+        try:
+            updated, deleted, cursor, has_more = changes_since(
+                self._meta.queryset, self._meta.resource_name, request.GET.get('since'), limit
+            )
+        except InvalidCursor:
+            raise ImmediateHttpResponse(response=HttpBadRequest("Invalid cursor."))
+
+        bundles = [self.build_bundle(obj=obj, request=request) for obj in updated]
+        bundles = [self.full_dehydrate(bundle) for bundle in bundles]
+
+        return self.create_response(
+            request,
+            {
+                'success': True,
+                'data': {
+                    'updated': bundles,
+                    'deleted': deleted,
+                    'next': cursor,
+                    'has_more': has_more
+                }
+            },
+            status=200
+        )
+
+class ListFilterMixin:
+    """
+    Pushes the query string of a list view down into SQL: the filters
+    declared in ``Meta.filtering`` (``name=``, ``name__icontains=``, ...),
+    ``mine=true`` for the caller's own rows, ``fields=`` sparse fieldsets,
+    which narrow the SELECT column list as well as the output, and
+    ``limit=``/``offset=`` paging.
+    """
+    # Filter name -> model lookup, for filters that are not model fields.
+    filter_lookups = {}
+
+    def list_filters(self, request, params):
+        """
+        Returns the ORM filters asked for in ``params``, the query string.
+        """
+        filters = {}
+        for param, value in params.items():
+            name, _, lookup = param.partition('__')
+            if (lookup or 'exact') not in self._meta.filtering.get(name, ()):
+                continue
+            filters['%s__%s' % (self.filter_lookups.get(name, name), lookup or 'exact')] = value
+        if params.get('mine') == 'true':
+            filters['owner_id'] = request.auth_claims['id']
+        return filters
+
+    def filter_list(self, queryset, filters):
+        try:
+            return queryset.filter(**filters)
+        except (TypeError, ValueError, ValidationError):
+            raise ImmediateHttpResponse(response=HttpBadRequest("Invalid filter."))
+
+    def page(self, params):
+        """
+        Returns the ``(limit, offset)`` asked for in ``params``. The limit
+        defaults to ``Meta.limit`` and is at most ``Meta.max_limit``.
+        """
+        try:
+            limit = int(params.get('limit', self._meta.limit))
+            offset = int(params.get('offset', 0))
+        except (TypeError, ValueError):
+            raise ImmediateHttpResponse(response=HttpBadRequest("Invalid limit or offset."))
+        if not 0 < limit <= self._meta.max_limit or offset < 0:
+            raise ImmediateHttpResponse(response=HttpBadRequest("Invalid limit or offset."))
+        return limit, offset
+
+    def sparse_fields(self, params):
+        """
+        Returns the field names asked for with ``fields=``, or None.
+        """
+        if 'fields' not in params:
+            return None
+        names = [name.strip() for name in params['fields'].split(',') if name.strip()]
+        unknown = [name for name in names if name not in self.fields]
+        if unknown or not names:
+            raise ImmediateHttpResponse(response=HttpBadRequest("Unknown fields: %s" % ', '.join(unknown)))
+        return names
+
+    def sparse_list(self, queryset, names):
+        """
+        Reads only the columns behind ``names`` and returns one dict per row.
+        Related fields come out as resource URIs, as in a full listing.
+        """
+        formatters = {}
+        for name in names:
+            field = self.fields[name]
+            if getattr(field, 'is_related', False):
+                related = field.to_class()
+                model = related._meta.object_class
+                formatters[name] = lambda pk, related=related, model=model: (
+                    None if pk is None else related.get_resource_uri(model(pk=pk))
+                )
+
+        rows = []
+        for values in queryset.values_list(*[self.fields[name].attribute for name in names]):
+            row = dict(zip(names, values))
+            for name, formatter in formatters.items():
+                row[name] = formatter(row[name])
+            rows.append(row)
+        return rows
@@ -2,8 +2,11 @@
 from __future__ import unicode_literals
 
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
 
+from orders_app import geo
+
 # Create your models here.
 # Custom user
 class CustomUser(models.Model):
@@ -14,19 +17,71 @@ class CustomUser(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     name = models.CharField(max_length=150, null=True)
     role = models.CharField(max_length=10, choices=ROLE_CHOICES)
+    # Bumped to revoke every token issued so far, see orders_app.revocation
+    token_generation = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return self.name
+
+    def save(self, *args, **kwargs):
+        # token_generation only moves forward through revoke_tokens, so a
+        # stale instance must not write it back.
+        if self.pk and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'token_generation'
+            ]
+        super(CustomUser, self).save(*args, **kwargs)
     
 # Store belongs to a Merchant
 class Store(models.Model):
-    name = models.CharField(max_length=150)
+    name = models.CharField(max_length=150, db_index=True)
     address = models.CharField(max_length=150, null=True)
     merchant = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    # The merchant's auth user, copied so ownership checks need no join
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', editable=False)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    # Square of the location, see orders_app.geo
+    grid_cell = models.IntegerField(null=True, db_index=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='store_changes_idx'),
+        ]
 
     def __str__(self):
         return self.name + ' ' + self.address
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Store, cls).from_db(db, field_names, values)
+        instance._loaded_owner_id = instance.__dict__.get('owner_id')
+        return instance
+
+    def save(self, *args, **kwargs):
+        self.owner_id = self.merchant.user_id
+        self.grid_cell = geo.grid_cell(self.latitude, self.longitude)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = list(update_fields)
+            if 'merchant' in update_fields:
+                update_fields.append('owner')
+            if 'latitude' in update_fields or 'longitude' in update_fields:
+                update_fields.append('grid_cell')
+            kwargs['update_fields'] = update_fields
+        super(Store, self).save(*args, **kwargs)
+
+        # A store handed to another merchant takes its items along.
+        previous_owner_id = getattr(self, '_loaded_owner_id', None)
+        if previous_owner_id is not None and previous_owner_id != self.owner_id:
+            from orders_app.signals import rows_updated
+            item_ids = list(Item.objects.filter(store=self).values_list('id', flat=True))
+            Item.objects.filter(store=self).update(owner_id=self.owner_id, updated_at=timezone.now())
+            rows_updated.send(sender=Item, pks=item_ids, store_ids=[self.pk])
+        self._loaded_owner_id = self.owner_id
+
 # Item belongs to a store
 class Item(models.Model):
     CATEGORY_CHOICES = (
@@ -36,14 +91,79 @@ class Item(models.Model):
         ('Dessert', 'Dessert'),
     )
 
-    name = models.CharField(max_length=150)
+    name = models.CharField(max_length=150, db_index=True)
     category = models.CharField(
         max_length=50,
         choices=CATEGORY_CHOICES
     )
     price = models.DecimalField(max_digits=6, decimal_places=2, default=0)
     store = models.ForeignKey(Store, on_delete=models.CASCADE)
+    # Copy of store.owner, kept in step by Store.save
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', editable=False)
+    # When the current price was submitted; the price feed never writes an older one
+    price_submitted_at = models.DateTimeField(null=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='item_changes_idx'),
+        ]
 
     def __str__(self):
         return self.name
-    
\ No newline at end of file
+
+    def save(self, *args, **kwargs):
+        self.owner_id = self.store.owner_id
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'store' in update_fields:
+            kwargs['update_fields'] = list(update_fields) + ['owner']
+        super(Item, self).save(*args, **kwargs)
+
+# Deleted Store or Item, kept for the change feed (orders_app.changes)
+class Tombstone(models.Model):
+    model = models.CharField(max_length=20)
+    object_id = models.IntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['model', 'deleted_at', 'id'], name='tombstone_changes_idx'),
+        ]
+    
+# Background job, see orders_app.jobs
+class Job(models.Model):
+    PENDING = 'Pending'
+    RUNNING = 'Running'
+    DONE = 'Done'
+    FAILED = 'Failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.TextField(default='{}')
+    dedupe_key = models.CharField(max_length=40, db_index=True)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    priority = models.SmallIntegerField(default=0)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True)
+    # Bumped by the worker while the job runs; see jobs.requeue_stale.
+    heartbeat_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+    result = models.TextField(null=True)
+    error = models.TextField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'priority', 'run_at'], name='job_queue_idx'),
+        ]
+
+    def __str__(self):
+        return '%s #%s' % (self.name, self.pk)
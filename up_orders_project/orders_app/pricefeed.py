@@ -0,0 +1,138 @@
+"""
+Price feed ingestion.
+
+POS systems push price changes for the same items many times a minute.
+Ownership is checked when prices are submitted; prices for items outside
+the sender's stores are skipped and never buffered. Updates are buffered
+per process and keyed by item, so the last write wins. Every
+``PRICE_FEED_FLUSH_INTERVAL`` seconds the buffer is written as one
+``UPDATE ... SET price = CASE id WHEN ... END`` per store and chunk, and
+``rows_updated`` is sent once so caches are invalidated once per flush.
+
+Each price carries the time it was submitted, stored in
+``Item.price_submitted_at``, and a flush only writes prices newer than the
+stored one. So when several processes buffer prices for the same item, the
+last submitted price wins whichever process flushes last.
+
+Buffered updates not yet flushed are lost if the process is killed. With
+an interval of 0 every submission is written immediately.
+"""
+import atexit
+import threading
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, When, Value, DecimalField, DateTimeField, F, Q
+from django.utils import timezone
+
+from orders_app.models import Item
+from orders_app.signals import rows_updated
+from orders_app.utils import chunked
+
+MAX_PRICE = Decimal('9999.99')
+
+# Items per UPDATE; each takes about six query parameters.
+FLUSH_CHUNK_SIZE = 100
+
+_lock = threading.Lock()
+_pending = {}
+_timer = None
+
+
+def parse_price(value):
+    """
+    Returns ``value`` as a two-place Decimal, or raises ValueError.
+    """
+    try:
+        price = Decimal(str(value)).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ValueError(value)
+    if price.is_nan() or not Decimal(0) <= price <= MAX_PRICE:
+        raise ValueError(value)
+    return price
+
+
+def submit(updates, user_id):
+    """
+    Buffers the ``(item_id, price)`` pairs sent by ``user_id`` for items of
+    the user's stores, and returns the ids of the other items, which are
+    skipped.
+    """
+    global _timer
+    submitted_at = timezone.now()
+    item_ids = set(item_id for item_id, _ in updates)
+    store_ids = {}
+    for chunk in chunked(item_ids, 500):
+        store_ids.update(Item.objects.filter(pk__in=chunk, owner_id=user_id).values_list('id', 'store_id'))
+
+    interval = settings.PRICE_FEED_FLUSH_INTERVAL
+    with _lock:
+        for item_id, price in updates:
+            if item_id in store_ids:
+                _pending[item_id] = (price, submitted_at, store_ids[item_id])
+        if interval and _timer is None:
+            _timer = threading.Timer(interval, _flush_in_background)
+            _timer.daemon = True
+            _timer.start()
+    if not interval:
+        flush()
+    return sorted(item_ids - set(store_ids))
+
+
+def _flush_in_background():
+    try:
+        flush()
+    finally:
+        connection.close()
+
+
+def flush():
+    """
+    Writes the buffered prices and returns the number of items updated.
+    """
+    global _pending, _timer
+    with _lock:
+        pending, _pending = _pending, {}
+        _timer = None
+    if not pending:
+        return 0
+
+    items_by_store = defaultdict(list)
+    for item_id, (_, _, store_id) in pending.items():
+        items_by_store[store_id].append(item_id)
+
+    def newer(item_id):
+        submitted_at = pending[item_id][1]
+        return Q(pk=item_id) & (Q(price_submitted_at=None) | Q(price_submitted_at__lt=submitted_at))
+
+    now = timezone.now()
+    updated = 0
+    with transaction.atomic():
+        for store_id, item_ids in items_by_store.items():
+            for chunk in chunked(item_ids, FLUSH_CHUNK_SIZE):
+                # Only rows whose stored price is older are matched.
+                guard = Q()
+                for item_id in chunk:
+                    guard |= newer(item_id)
+                updated += Item.objects.filter(store_id=store_id).filter(guard).update(
+                    price=Case(
+                        *[When(pk=item_id, then=Value(pending[item_id][0])) for item_id in chunk],
+                        default=F('price'),
+                        output_field=DecimalField(max_digits=6, decimal_places=2)
+                    ),
+                    price_submitted_at=Case(
+                        *[When(pk=item_id, then=Value(pending[item_id][1])) for item_id in chunk],
+                        default=F('price_submitted_at'),
+                        output_field=DateTimeField()
+                    ),
+                    updated_at=now
+                )
+
+    if updated:
+        rows_updated.send(sender=Item, pks=list(pending), store_ids=list(items_by_store))
+    return updated
+
+
+atexit.register(flush)
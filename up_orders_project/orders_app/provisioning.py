@@ -0,0 +1,165 @@
+"""
+Bulk user provisioning, e.g. when migrating users from another platform.
+
+Creating users one signup at a time costs an existence query, a password
+hash and three inserts (``User``, the ``ApiKey`` that ``create_api_key``
+adds, ``CustomUser``) per user. Here usernames are checked in batches,
+passwords are hashed on a process pool, since hashing is CPU bound and
+dominates the cost, and the rows are inserted with ``bulk_create``, one
+transaction per chunk. No token is issued; provisioned users log in.
+
+``bulk_create`` does not send ``post_save``, so the ``ApiKey`` rows are
+created here.
+"""
+import multiprocessing
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+from django.utils import six
+from tastypie.models import ApiKey
+
+from orders_app.models import CustomUser
+from orders_app.utils import chunked
+
+ROLES = dict(CustomUser.ROLE_CHOICES)
+USERNAME_MAX_LENGTH = User._meta.get_field('username').max_length
+
+
+def validate(row):
+    """
+    Returns why ``row`` cannot be provisioned, or None. Rows come from
+    JSON, so every value is checked to be a string first.
+    """
+    username = row.get('username')
+    if not isinstance(username, six.string_types) or not username or len(username) > USERNAME_MAX_LENGTH:
+        return 'Username is not valid.'
+    if not isinstance(row.get('password'), six.string_types) or not row['password']:
+        return 'Password is required.'
+    if not isinstance(row.get('role'), six.string_types) or row['role'] not in ROLES:
+        return 'Role is not valid.'
+    if not isinstance(row.get('email'), six.string_types):
+        return 'Email is not valid.'
+    try:
+        validate_email(row['email'])
+    except ValidationError:
+        return 'Email is not valid.'
+    if row.get('name') is not None and not isinstance(row['name'], six.string_types):
+        return 'Name is not valid.'
+    return None
+
+
+def existing_usernames(usernames, chunk_size):
+    existing = set()
+    for chunk in chunked(usernames, chunk_size):
+        existing.update(User.objects.filter(username__in=chunk).values_list('username', flat=True))
+    return existing
+
+
+def hash_passwords(passwords, processes):
+    """
+    Returns the hashes of ``passwords``, in order. With ``processes`` set
+    to 1 they are hashed in this process.
+    """
+    if processes == 1 or len(passwords) < 2:
+        return [make_password(password) for password in passwords]
+    # The forked workers only hash; they never touch the database.
+    pool = multiprocessing.Pool(processes)
+    try:
+        return pool.map(make_password, passwords, chunksize=max(1, len(passwords) // (processes * 4)))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def insert(rows, hashes):
+    """
+    Inserts the users of ``rows`` in one transaction and returns how many
+    were created.
+    """
+    with transaction.atomic():
+        User.objects.bulk_create([
+            User(username=row['username'], email=row['email'], password=password)
+            for row, password in zip(rows, hashes)
+        ])
+        # bulk_create only returns primary keys on PostgreSQL.
+        ids = dict(User.objects.filter(
+            username__in=[row['username'] for row in rows]
+        ).values_list('username', 'id'))
+        ApiKey.objects.bulk_create([
+            ApiKey(user_id=ids[row['username']], key=ApiKey().generate_key()) for row in rows
+        ])
+        CustomUser.objects.bulk_create([
+            CustomUser(user_id=ids[row['username']], name=row.get('name') or row['username'], role=row['role'])
+            for row in rows
+        ])
+    return len(rows)
+
+
+def provision(users, processes=None, chunk_size=None):
+    """
+    Creates the ``users``, dicts with ``username``, ``password``, ``email``,
+    ``role`` and optionally ``name``. Usernames that are taken, repeated or
+    invalid are skipped.
+
+    Returns ``{created, skipped: [{username, reason}], seconds,
+    users_per_second}`` and the seconds spent per phase.
+
+    Every user is created in full or not at all. Running it again for the
+    same users skips those already created.
+    """
+    processes = processes or settings.PROVISION_PROCESSES or multiprocessing.cpu_count()
+    chunk_size = chunk_size or settings.PROVISION_CHUNK_SIZE
+    start = time.time()
+
+    skipped = []
+    rows = []
+    seen = set()
+    for row in users:
+        reason = validate(row)
+        if reason is None and row['username'] in seen:
+            reason = 'Username is repeated.'
+        if reason:
+            skipped.append({'username': row.get('username'), 'reason': reason})
+            continue
+        seen.add(row['username'])
+        rows.append(row)
+
+    existing = existing_usernames([row['username'] for row in rows], chunk_size)
+    skipped.extend({'username': username, 'reason': 'Username already exists'} for username in sorted(existing))
+    rows = [row for row in rows if row['username'] not in existing]
+    checked = time.time()
+
+    hashes = hash_passwords([row['password'] for row in rows], processes)
+    hashed = time.time()
+
+    created = 0
+    for chunk in chunked(list(zip(rows, hashes)), chunk_size):
+        try:
+            created += insert([row for row, _ in chunk], [password for _, password in chunk])
+        except IntegrityError:
+            # A username collided although it was checked: it was taken
+            # since, or differs from another only in case under a case
+            # insensitive collation. Insert the chunk one user at a time
+            # and skip the collisions.
+            for row, password in chunk:
+                try:
+                    created += insert([row], [password])
+                except IntegrityError:
+                    skipped.append({'username': row['username'], 'reason': 'Username already exists'})
+    finished = time.time()
+
+    seconds = finished - start
+    return {
+        'created': created,
+        'skipped': skipped,
+        'seconds': round(seconds, 3),
+        'users_per_second': round(created / seconds, 1) if seconds else None,
+        'check_seconds': round(checked - start, 3),
+        'hash_seconds': round(hashed - checked, 3),
+        'insert_seconds': round(finished - hashed, 3),
+    }
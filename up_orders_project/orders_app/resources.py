@@ -1,4 +1,4 @@
-from tastypie.resources import ModelResource
+from tastypie.resources import ModelResource, Resource
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
 from tastypie import fields
@@ -8,16 +8,53 @@ from tastypie.authentication import Authentication
 from tastypie.http import HttpBadRequest, HttpCreated, HttpNotFound, HttpUnauthorized
 from tastypie.http import HttpApplicationError, HttpForbidden
 from tastypie.models import ApiKey
+from django.conf import settings
 from django.conf.urls import url
 import jwt
 from datetime import datetime, timedelta
-import pytz
 from tastypie.exceptions import ImmediateHttpResponse
 from django.core.validators import validate_email
 from django.core.exceptions import ValidationError
+from django.utils.functional import SimpleLazyObject
+from django.utils import six, timezone
+import json
+
+from orders_app.models import CustomUser, Store, Item, Job
+from orders_app.mixins import CustomUserMixin, ChangeFeedMixin, ListFilterMixin
+from orders_app.jobs import enqueue
+from orders_app.revocation import is_revoked, revoke_tokens
+from orders_app import cache as read_cache
+from orders_app import composite, facets, geo, pricefeed
+from orders_app.signals import rows_updated
+from orders_app.serializers import CompactSerializer
+
+def dehydrated(resource, obj, request):
+    # The resource's output for obj as plain data, which can be cached.
+    bundle = resource.full_dehydrate(resource.build_bundle(obj=obj, request=request))
+    return resource._meta.serializer.to_simple(bundle, {})
+
+
+def object_id(pk, not_found):
+    # The integer id in a URL or composite part, so that cache keys and
+    # scopes built from it match those that writes invalidate.
+    try:
+        return int(pk)
+    except (TypeError, ValueError):
+        raise ImmediateHttpResponse(response=HttpNotFound(not_found))
+
+
+def cleaned(model, values):
+    # values validated and converted as model.full_clean would, for those
+    # fields only; 400 if any is invalid.
+    instance = model(**values)
+    try:
+        instance.clean_fields(exclude=[field.name for field in model._meta.fields if field.name not in values])
+    except ValidationError as e:
+        raise ImmediateHttpResponse(response=HttpBadRequest(' '.join(
+            '%s: %s' % (name, ' '.join(messages)) for name, messages in sorted(e.message_dict.items())
+        )))
+    return dict((name, getattr(instance, name)) for name in values)
 
-from orders_app.models import CustomUser, Store, Item
-from orders_app.mixins import CustomUserMixin
 
 class JWTAuthentication(Authentication):
     def _get_token_from_header(self, request):
@@ -37,12 +74,14 @@ class JWTAuthentication(Authentication):
                 key="hakuna matata",
                 algorithms="HS256"
             )
-            user = User.objects.get(pk=decoded_payload['id'])
-            if user:
-                request.user = user
-                return True
-            else:
+            if is_revoked(decoded_payload):
                 return False
+            # The user row is only loaded if the view needs it; the id and
+            # role are taken from the token.
+            user_id = decoded_payload['id']
+            request.user = SimpleLazyObject(lambda: User.objects.get(pk=user_id))
+            request.auth_claims = decoded_payload
+            return True
         except Exception as e:
             return False
         
@@ -55,10 +94,14 @@ class RoleBasedAuthorization(Authorization):
 
     def is_authorized(self, request):
         print("===authorization===")
-        username = request.user
-        custom_user = CustomUser.objects.get(user__username=username)
-        print(custom_user.role)
-        return custom_user.role == self.required_role
+        # Role changes revoke earlier tokens, so the role claim is current.
+        claims = getattr(request, 'auth_claims', None)
+        if claims and 'role' in claims:
+            role = claims['role']
+        else:
+            username = request.user
+            role = CustomUser.objects.get(user__username=username).role
+        return role == self.required_role
     
     def create_detail(self, object_list, bundle):
         if not self.is_authorized(bundle.request):
@@ -101,14 +144,19 @@ class UserResource(ModelResource):
         return [
             url(r'^user/signup/$', self.wrap_view('signup'), name='user_signup'),
             url(r'^user/login/$', self.wrap_view('login'), name='user_login'),
+            url(r'^user/logout/$', self.wrap_view('logout'), name='user_logout'),
+            url(r'^user/provision/$', self.wrap_view('provision'), name='user_provision'),
         ]
     
-    def generate_token(self, user_id, role):
+    def generate_token(self, user_id, role, generation=0):
+        # Only needed on signup/login, so kept out of worker start-up.
+        import pytz
         IST = pytz.timezone('Asia/Kolkata')
         return jwt.encode(
             payload={
                 'id': user_id,
                 'role': role,
+                'gen': generation,
                 'exp': datetime.now(IST) + timedelta(days=30),
                 'iat': datetime.now(IST)
             },
@@ -155,6 +203,41 @@ class UserResource(ModelResource):
             response_class=HttpCreated
         )
     
+    def provision(self, request, **kwargs):
+        """
+        Queues the creation of many users at once; staff only. The body is
+        ``{"users": [{username, password, email, role, [name]}, ...]}``.
+        """
+        self.method_check(request, allowed=['post'])
+        if JWTAuthentication().is_authenticated(request) is not True:
+            raise ImmediateHttpResponse(response=HttpUnauthorized("Invalid token."))
+        if not request.user.is_staff:
+            raise ImmediateHttpResponse(response=HttpForbidden("Staff only."))
+
+        data = self.deserialize(
+            request, request.body, format=request.META.get('CONTENT_TYPE', 'application/json')
+        )
+        users = data.get('users')
+        if not isinstance(users, list) or not users:
+            raise ImmediateHttpResponse(response=HttpBadRequest("users is required."))
+        if len(users) > settings.PROVISION_MAX_USERS:
+            raise ImmediateHttpResponse(
+                response=HttpBadRequest("At most %d users per request." % settings.PROVISION_MAX_USERS)
+            )
+        if not all(isinstance(user, dict) for user in users):
+            raise ImmediateHttpResponse(response=HttpBadRequest("Invalid user."))
+
+        job = enqueue('provision_users', {'users': users}, user=request.user)
+
+        return self.create_response(
+            request,
+            {
+                'success': True,
+                'job_id': job.pk
+            },
+            status=202
+        )
+
     def login(self, request, **kwargs):
         self.method_check(request, allowed=['post'])
 
@@ -170,7 +253,9 @@ class UserResource(ModelResource):
             raise ImmediateHttpResponse(response=HttpNotFound("User not found."))
         
         custom_user = CustomUser.objects.get(user__username=username)
-        token = self.generate_token(user_id=existing_user.id, role=custom_user.role)
+        token = self.generate_token(
+            user_id=existing_user.id, role=custom_user.role, generation=custom_user.token_generation
+        )
 
         return self.create_response(
             request,
@@ -181,6 +266,23 @@ class UserResource(ModelResource):
             status=200
         )
 
+    def logout(self, request, **kwargs):
+        self.method_check(request, allowed=['post'])
+
+        if JWTAuthentication().is_authenticated(request) is not True:
+            raise ImmediateHttpResponse(response=HttpUnauthorized("Invalid token."))
+
+        # Revokes every token of the user, not only the one presented.
+        revoke_tokens(request.auth_claims['id'])
+
+        return self.create_response(
+            request,
+            {
+                'success': True
+            },
+            status=200
+        )
+
 class CustomUserResource(ModelResource):
     user = fields.OneToOneField(UserResource, 'user', full=True)
 
@@ -201,23 +303,27 @@ class CustomUserResource(ModelResource):
     def get_custom_user(self, request, **kwargs):
         self.method_check(request, allowed=['get'])
 
-        pk = kwargs.get('pk', None)
-
-        try:
-            custom_user = CustomUser.objects.get(user__id=pk)
-        except CustomUser.DoesNotExist:
-            raise ImmediateHttpResponse(response=HttpNotFound("Custom user not found."))
-        
-        bundle = self.build_bundle(obj=custom_user, request=request)
-        bundle = self.full_dehydrate(bundle)
+        body = self.read_custom_user(request, kwargs.get('pk', None))
 
         return self.create_response(
             request,
-            bundle,
+            body['data'],
             status=200
         )
+
+    def read_custom_user(self, request, pk):
+        pk = object_id(pk, "Custom user not found.")
+
+        def load():
+            try:
+                custom_user = CustomUser.objects.select_related('user').get(user__id=pk)
+            except CustomUser.DoesNotExist:
+                raise ImmediateHttpResponse(response=HttpNotFound("Custom user not found."))
+            return dehydrated(self, custom_user, request)
+
+        return {'data': read_cache.read_through('get_custom_user', read_cache.custom_user_scopes(pk), (pk,), load)}
     
-class StoreResource(ModelResource, CustomUserMixin):
+class StoreResource(ModelResource, CustomUserMixin, ChangeFeedMixin, ListFilterMixin):
     # merchant = fields.ForeignKey(CustomUser, 'merchant')
 
     class Meta:
@@ -233,12 +339,16 @@ class StoreResource(ModelResource, CustomUserMixin):
             'merchant': ['exact'],
             'name': ['exact', 'icontains']
         }
-        excludes = ['merchant']
+        excludes = ['merchant', 'grid_cell']
+        serializer = CompactSerializer()
+        max_limit = 100
 
     def prepend_urls(self):
         return [
             url(r"^store/create/$", self.wrap_view('create_store'), name='create_store'),
             url(r"^store/get/many/$", self.wrap_view('get_stores'), name='get_stores'),
+            url(r"^store/nearby/$", self.wrap_view('get_nearby_stores'), name='get_nearby_stores'),
+            url(r"^store/changes/$", self.wrap_view('get_changes'), name='get_store_changes'),
             url(r"^store/get/(?P<pk>.*?)/$", self.wrap_view('get_store_detail'), name='get_store_detail'),
             url(r"^store/(?P<pk>.*?)/update/$", self.wrap_view('update_store'), name='update_store'),
             url(r"^store/(?P<pk>.*?)/delete/$", self.wrap_view('delete_store'), name='delete_store'),
@@ -257,7 +367,7 @@ class StoreResource(ModelResource, CustomUserMixin):
         data = self.deserialize(
             request, request.body, format=request.META.get("CONTENT_TYPE", "application/json")
         )
-        custom_user = CustomUser.objects.get(user__username=request.user)
+        custom_user = CustomUser.objects.get(user_id=request.auth_claims['id'])
         name = data['name']
         address = data['address']
         merchant = custom_user
@@ -284,41 +394,90 @@ class StoreResource(ModelResource, CustomUserMixin):
         self.method_check(request, ['get'])
         self.is_authenticated(request)
 
-        stores = Store.objects.all()
-        bundles = [self.build_bundle(obj=store, request=request) for store in stores]
-        bundles = [self.full_dehydrate(bundle) for bundle in bundles]
+        body = self.read_stores(request, request.GET)
 
-        return self.create_response(
-            request,
-            {
-                'success': True,
-                'data': bundles
-            },
-            status=200
+        return self.create_response(request, dict(body, success=True), status=200)
+
+    def read_stores(self, request, params):
+        filters = self.list_filters(request, params)
+        stores = self.filter_list(Store.objects.order_by('pk'), filters)
+        fields = self.sparse_fields(params)
+        limit, offset = self.page(params)
+
+        # One row past the page tells whether another page follows.
+        def load():
+            page = stores[offset:offset + limit + 1]
+            if fields:
+                return self.sparse_list(page, fields)
+            return [dehydrated(self, store, request) for store in page]
+
+        rows = read_cache.read_through(
+            'get_stores', read_cache.store_list_scopes(), (sorted(filters.items()), fields, limit, offset), load
         )
+        return {
+            'data': rows[:limit],
+            'meta': {'limit': limit, 'offset': offset, 'has_more': len(rows) > limit}
+        }
     
-    def get_store_detail(self, request, **kwargs):
+    def get_nearby_stores(self, request, **kwargs):
         self.method_check(request, ['get'])
         self.is_authenticated(request)
 
-        pk = kwargs.get('pk', None)
+        body = self.read_nearby_stores(request, request.GET)
 
+        return self.create_response(request, dict(body, success=True), status=200)
+
+    def read_nearby_stores(self, request, params):
         try:
-            store = Store.objects.get(pk=pk)
-        except Store.DoesNotExist:
-            raise ImmediateHttpResponse(response=HttpNotFound("Store not found."))
-        
-        bundle = self.build_bundle(obj=store, request=request)
-        bundle = self.full_dehydrate(bundle)
+            lat = float(params['lat'])
+            lng = float(params['lng'])
+            radius = float(params.get('radius', 5))
+            limit = int(params.get('limit', self._meta.limit))
+            offset = int(params.get('offset', 0))
+        except (KeyError, ValueError):
+            raise ImmediateHttpResponse(response=HttpBadRequest("lat and lng are required numbers."))
+        if not geo.valid_point(lat, lng) or not 0 < radius <= geo.MAX_RADIUS_KM:
+            raise ImmediateHttpResponse(response=HttpBadRequest(
+                "Invalid location or radius (at most %d km)." % geo.MAX_RADIUS_KM
+            ))
+        if not 0 < limit <= self._meta.max_limit or offset < 0:
+            raise ImmediateHttpResponse(response=HttpBadRequest("Invalid limit or offset."))
+
+        # Distances come from the grid index; only the page is loaded.
+        results = geo.nearby(Store.objects.all(), lat, lng, radius)
+        page = results[offset:offset + limit]
+        stores = Store.objects.in_bulk([pk for _, pk in page])
+
+        bundles = []
+        for distance, pk in page:
+            bundle = self.full_dehydrate(self.build_bundle(obj=stores[pk], request=request))
+            bundle.data['distance_km'] = round(distance, 3)
+            bundles.append(bundle)
+
+        return {
+            'data': bundles,
+            'meta': {'limit': limit, 'offset': offset, 'total_count': len(results)}
+        }
 
-        return self.create_response(
-            request,
-            {
-                'success': True,
-                'data': bundle
-            },
-            status=200
-        )
+    def get_store_detail(self, request, **kwargs):
+        self.method_check(request, ['get'])
+        self.is_authenticated(request)
+
+        body = self.read_store(request, kwargs.get('pk', None))
+
+        return self.create_response(request, dict(body, success=True), status=200)
+
+    def read_store(self, request, pk):
+        pk = object_id(pk, "Store not found.")
+
+        def load():
+            try:
+                store = Store.objects.get(pk=pk)
+            except Store.DoesNotExist:
+                raise ImmediateHttpResponse(response=HttpNotFound("Store not found."))
+            return dehydrated(self, store, request)
+
+        return {'data': read_cache.read_through('get_store_detail', read_cache.store_scopes(pk), (pk,), load)}
     
     def update_store(self, request, **kwargs):
         self.method_check(request, ['patch'])
@@ -333,33 +492,27 @@ class StoreResource(ModelResource, CustomUserMixin):
         data = self.deserialize(
             request, request.body, format=request.META.get("CONTENT_TYPE", "application/json")
         )
-        name = data['name']
-        address = data['address']
-
+        # Only the fields present in the body are written.
+        values = dict((name, data[name]) for name in ('name', 'address') if name in data)
+        if not values:
+            raise ImmediateHttpResponse(response=HttpBadRequest("Nothing to update."))
+        values = cleaned(Store, values)
+        values['updated_at'] = timezone.now()
+
+        # Ownership check and write in one conditional UPDATE.
         try:
-            store = Store.objects.get(pk=pk, merchant__user__username=request.user)
-            # if store.merchant.user.username != request.user:
-            #     return self.create_response(
-            #         request,
-            #         {
-            #             'success': False,
-            #             'error_msg': "You are not authroized to perform this action."
-            #         }
-            #     )
-            store.name = name
-            store.address = address
-            store.save()
-        except Store.DoesNotExist:
+            updated = Store.objects.filter(pk=int(pk), owner_id=request.auth_claims['id']).update(**values)
+        except ValueError:
+            updated = 0
+        if not updated:
             raise ImmediateHttpResponse(response=HttpNotFound("Store not found."))
-
-        bundle = self.build_bundle(obj=store, request=request)
-        bundle = self.full_dehydrate(bundle)
+        rows_updated.send(sender=Store, pks=[int(pk)], store_ids=[int(pk)])
 
         return self.create_response(
             request,
             {
                 'success': True,
-                'data': bundle
+                'data': dict(values, id=int(pk))
             },
             status=200
         )
@@ -377,27 +530,29 @@ class StoreResource(ModelResource, CustomUserMixin):
         pk = kwargs.get('pk', None)
 
         try:
-            store = Store.objects.get(pk=pk, merchant__user__username=request.user)
-            store.delete()
+            store = Store.objects.get(pk=pk, owner_id=request.auth_claims['id'])
         except Store.DoesNotExist:
             raise ImmediateHttpResponse(response=HttpNotFound("Store not found."))
-        except:
-            raise ImmediateHttpResponse(response=HttpApplicationError("Could not delete."))
-        
+
+        # Deleting a store cascades to all of its items, so it is done by a
+        # background worker.
+        job = enqueue('purge_store', {'store_id': store.pk}, user=request.user)
 
         return self.create_response(
             request,
             {
-                'success': True
+                'success': True,
+                'job_id': job.pk
             },
             status=202
         )
 
-class ItemResource(ModelResource, CustomUserMixin):
+class ItemResource(ModelResource, CustomUserMixin, ChangeFeedMixin, ListFilterMixin):
     store = fields.ForeignKey(StoreResource, 'store')
 
     class Meta:
-        queryset = Item.objects.all()
+        # The store URI is part of every item, so load it in the same query.
+        queryset = Item.objects.select_related('store')
         resource_name = 'item'
         allowed_methods = ['get', 'post', 'put', 'delete']
         list_allowed_methods = ['get']
@@ -407,14 +562,24 @@ class ItemResource(ModelResource, CustomUserMixin):
         limit = 20
         filtering = {
             'store': ['exact'],
-            'name': ['exact', 'icontains']
+            'merchant': ['exact'],
+            'name': ['exact', 'icontains'],
+            'category': ['exact'],
+            'price': ['lt', 'lte', 'gt', 'gte']
         }
-        excludes = ['store']
+        excludes = ['store', 'price_submitted_at']
+        serializer = CompactSerializer()
+        max_limit = 100
+
+    filter_lookups = {'merchant': 'store__merchant'}
 
     def prepend_urls(self):
         return [
             url(r"^item/create/$", self.wrap_view('create_item'), name='create_item'),
+            url(r"^item/import/$", self.wrap_view('import_items'), name='import_items'),
+            url(r"^item/prices/$", self.wrap_view('update_prices'), name='update_prices'),
             url(r"^item/get/many/$", self.wrap_view('get_items'), name='get_items'),
+            url(r"^item/changes/$", self.wrap_view('get_changes'), name='get_item_changes'),
             url(r"^item/get/(?P<pk>.*?)/$", self.wrap_view('get_item_detail'), name='get_item_detail'),
             url(r"^item/(?P<pk>.*?)/update/$", self.wrap_view('update_item'), name='update_item'),
             url(r"^item/(?P<pk>.*?)/delete/$", self.wrap_view('delete_item'), name='delete_item'),
@@ -440,7 +605,7 @@ class ItemResource(ModelResource, CustomUserMixin):
         store_id = data['store_id']
 
         try:
-            store = Store.objects.get(pk=store_id, merchant__user__username=request.user)
+            store = Store.objects.get(pk=store_id, owner_id=request.auth_claims['id'])
             item = Item.objects.create(
                 name=name,
                 category=category,
@@ -462,45 +627,133 @@ class ItemResource(ModelResource, CustomUserMixin):
             status=201
         )
     
-    def get_items(self, request, **kwargs):
-        self.method_check(request, ['get'])
+    def import_items(self, request, **kwargs):
+        self.method_check(request, allowed=['post'])
         self.is_authenticated(request)
 
-        items = Item.objects.all()
-        bundles = [self.build_bundle(obj=item, request=request) for item in items]
-        bundles = [self.full_dehydrate(bundle) for bundle in bundles]
+        authorization = RoleBasedAuthorization("Merchant")
+        if not authorization.is_authorized(request=request):
+            raise ImmediateHttpResponse(
+                response=HttpUnauthorized("You are unauthorized to perform this action.")
+            )
+
+        data = self.deserialize(
+            request, request.body, format=request.META.get("CONTENT_TYPE", "application/json")
+        )
+        store_id = data['store_id']
+        items = data['items']
+
+        categories = dict(Item.CATEGORY_CHOICES)
+        for index, item in enumerate(items):
+            try:
+                if not item.get('name') or item.get('category') not in categories:
+                    raise ValueError(item)
+                item['price'] = pricefeed.parse_price(item.get('price'))
+            except (AttributeError, ValueError):
+                raise ImmediateHttpResponse(response=HttpBadRequest("Invalid item at index %d." % index))
+
+        if not Store.objects.filter(pk=store_id, owner_id=request.auth_claims['id']).exists():
+            raise ImmediateHttpResponse(response=HttpNotFound("Store not found."))
+
+        job = enqueue('import_menu', {'store_id': store_id, 'items': items}, user=request.user)
 
         return self.create_response(
             request,
             {
                 'success': True,
-                'data': bundles
+                'job_id': job.pk
             },
-            status=200
+            status=202
         )
-    
-    def get_item_detail(self, request, **kwargs):
-        self.method_check(request, ['get'])
+
+    def update_prices(self, request, **kwargs):
+        self.method_check(request, allowed=['post'])
         self.is_authenticated(request)
 
-        pk = kwargs.get('pk', None)
+        authorization = RoleBasedAuthorization("Merchant")
+        if not authorization.is_authorized(request=request):
+            raise ImmediateHttpResponse(
+                response=HttpUnauthorized("You are unauthorized to perform this action.")
+            )
 
+        data = self.deserialize(
+            request, request.body, format=request.META.get("CONTENT_TYPE", "application/json")
+        )
         try:
-            item = Item.objects.get(pk=pk)
-        except Item.DoesNotExist:
-            raise ImmediateHttpResponse(response=HttpNotFound("Item not found."))
-        
-        bundle = self.build_bundle(obj=item, request=request)
-        bundle = self.full_dehydrate(bundle)
+            updates = [
+                (int(update['item_id']), pricefeed.parse_price(update['price']))
+                for update in data['updates']
+            ]
+        except (KeyError, TypeError, ValueError):
+            raise ImmediateHttpResponse(response=HttpBadRequest("Invalid price update."))
+
+        # Applied in the background, coalesced with other updates to the
+        # same items, see orders_app.pricefeed.
+        skipped = pricefeed.submit(updates, user_id=request.auth_claims['id'])
+        skipped_ids = set(skipped)
 
         return self.create_response(
             request,
             {
                 'success': True,
-                'data': bundle
+                'accepted': len([item_id for item_id, _ in updates if item_id not in skipped_ids]),
+                'skipped': skipped
             },
-            status=200
+            status=202
+        )
+
+    def get_items(self, request, **kwargs):
+        self.method_check(request, ['get'])
+        self.is_authenticated(request)
+
+        body = self.read_items(request, request.GET)
+
+        return self.create_response(request, dict(body, success=True), status=200)
+
+    def read_items(self, request, params):
+        filters = self.list_filters(request, params)
+        items = self.filter_list(Item.objects.order_by('pk'), filters)
+        fields = self.sparse_fields(params)
+        store_id = filters.get('store__exact')
+        limit, offset = self.page(params)
+
+        # One row past the page tells whether another page follows.
+        def load():
+            page = items[offset:offset + limit + 1]
+            if fields:
+                return self.sparse_list(page, fields)
+            return [dehydrated(self, item, request) for item in page.select_related('store')]
+
+        rows = read_cache.read_through(
+            'get_items', read_cache.item_list_scopes(store_id), (sorted(filters.items()), fields, limit, offset), load
         )
+        body = {
+            'data': rows[:limit],
+            'meta': {'limit': limit, 'offset': offset, 'has_more': len(rows) > limit}
+        }
+        if params.get('facets') == 'true':
+            body['facets'] = facets.item_facets(items, store_id=store_id, scope=sorted(filters.items()))
+        return body
+    
+    def get_item_detail(self, request, **kwargs):
+        self.method_check(request, ['get'])
+        self.is_authenticated(request)
+
+        body = self.read_item(request, kwargs.get('pk', None))
+
+        return self.create_response(request, dict(body, success=True), status=200)
+
+    def read_item(self, request, pk):
+        pk = object_id(pk, "Item not found.")
+
+        def load():
+            try:
+                item = Item.objects.select_related('store').get(pk=pk)
+            except Item.DoesNotExist:
+                raise ImmediateHttpResponse(response=HttpNotFound("Item not found."))
+            return dehydrated(self, item, request)
+
+        return {'data': read_cache.read_through('get_item_detail', read_cache.item_scopes(pk), (pk,), load)}
     
     def update_item(self, request, **kwargs):
         self.method_check(request, ['patch'])
@@ -515,39 +768,42 @@ class ItemResource(ModelResource, CustomUserMixin):
         data = self.deserialize(
             request, request.body, format=request.META.get("CONTENT_TYPE", "application/json")
         )
-        name = data['name']
-        category = data['category']
-        price = data['price']
-        store_id = data['store_id']
-
+        # Only the fields present in the body are written. store_id, if
+        # given, narrows the update to that store; it does not move the item.
+        values = dict((name, data[name]) for name in ('name', 'category', 'price') if name in data)
+        if not values:
+            raise ImmediateHttpResponse(response=HttpBadRequest("Nothing to update."))
+        if 'category' in values and values['category'] not in dict(Item.CATEGORY_CHOICES):
+            raise ImmediateHttpResponse(response=HttpBadRequest("Invalid category."))
+        if 'price' in values:
+            try:
+                values['price'] = pricefeed.parse_price(values['price'])
+            except ValueError:
+                raise ImmediateHttpResponse(response=HttpBadRequest("Invalid price."))
+        values = cleaned(Item, values)
+        values['updated_at'] = timezone.now()
+        # Price feed updates submitted before this one are not applied.
+        stamps = {'price_submitted_at': values['updated_at']} if 'price' in values else {}
+
+        # Ownership check and write in one conditional UPDATE.
         try:
-            store = Store.objects.get(pk=store_id, merchant__user__username=request.user)
-            item = Item.objects.get(pk=pk, store=store)
-            # if store.merchant.user.username != request.user:
-            #     return self.create_response(
-            #         request,
-            #         {
-            #             'success': False,
-            #             'error_msg': "You are not authroized to perform this action."
-            #         }
-            #     )
-            item.name = name
-            item.category = category
-            item.price = price
-            item.save()
-        except Store.DoesNotExist:
-            raise ImmediateHttpResponse(response=HttpNotFound("Store not found."))
-        except Item.DoesNotExist:
+            items = Item.objects.filter(pk=int(pk), owner_id=request.auth_claims['id'])
+            if 'store_id' in data:
+                items = items.filter(store_id=int(data['store_id']))
+            updated = items.update(**dict(values, **stamps))
+        except (TypeError, ValueError):
+            updated = 0
+        if not updated:
             raise ImmediateHttpResponse(response=HttpNotFound("Item not found."))
-
-        bundle = self.build_bundle(obj=item, request=request)
-        bundle = self.full_dehydrate(bundle)
+        rows_updated.send(
+            sender=Item, pks=[int(pk)], store_ids=[int(data['store_id'])] if 'store_id' in data else None
+        )
 
         return self.create_response(
             request,
             {
                 'success': True,
-                'data': bundle
+                'data': dict(values, id=int(pk))
             },
             status=200
         )
@@ -565,11 +821,10 @@ class ItemResource(ModelResource, CustomUserMixin):
         pk = kwargs.get('pk', None)
 
         try:
-            # store = Store.objects.get(pk=pk, merchant__user__username=request.user)
-            item = Item.objects.get(pk=pk)
+            item = Item.objects.get(pk=pk, owner_id=request.auth_claims['id'])
             item.delete()
-        except Store.DoesNotExist:
-            raise ImmediateHttpResponse(response=HttpNotFound("Store not found."))
+        except Item.DoesNotExist:
+            raise ImmediateHttpResponse(response=HttpNotFound("Item not found."))
         except:
             raise ImmediateHttpResponse(response=HttpApplicationError("Could not delete."))
         
@@ -582,4 +837,138 @@ class ItemResource(ModelResource, CustomUserMixin):
             status=202
         )
 
-    
+
+class JobResource(ModelResource):
+    class Meta:
+        queryset = Job.objects.all()
+        resource_name = 'job'
+        allowed_methods = ['get']
+        list_allowed_methods = []
+        authentication = JWTAuthentication()
+        authorization = Authorization()
+        include_resource_uri = False
+        fields = ['id', 'name', 'status', 'attempts', 'created_at', 'started_at', 'finished_at', 'result', 'error']
+
+    def prepend_urls(self):
+        return [
+            url(r"^job/get/(?P<pk>.*?)/$", self.wrap_view('get_job'), name='get_job'),
+        ]
+
+    def dehydrate_result(self, bundle):
+        return json.loads(bundle.obj.result) if bundle.obj.result else None
+
+    def dehydrate_error(self, bundle):
+        # Only the exception line; the traceback stays in the database.
+        return bundle.obj.error.strip().splitlines()[-1] if bundle.obj.error else None
+
+    def get_job(self, request, **kwargs):
+        self.method_check(request, ['get'])
+        self.is_authenticated(request)
+
+        pk = kwargs.get('pk', None)
+
+        try:
+            job = Job.objects.get(pk=pk)
+        except Job.DoesNotExist:
+            raise ImmediateHttpResponse(response=HttpNotFound("Job not found."))
+
+        if job.user_id != request.user.id and not request.user.is_staff:
+            raise ImmediateHttpResponse(response=HttpNotFound("Job not found."))
+
+        bundle = self.build_bundle(obj=job, request=request)
+        bundle = self.full_dehydrate(bundle)
+
+        return self.create_response(
+            request,
+            {
+                'success': True,
+                'data': bundle
+            },
+            status=200
+        )
+
+
+class CompositeResource(Resource):
+    """
+    Runs several reads in one request, e.g. everything a home screen needs::
+
+        {"parts": [
+            {"name": "me", "type": "custom_user", "id": 4},
+            {"name": "near", "type": "nearby_stores", "params": {"lat": 12.97, "lng": 77.59}},
+            {"name": "menu", "type": "items", "params": {"store": 7, "fields": ["id", "name", "price"]}}
+        ]}
+
+    ``params`` are the query string parameters of the equivalent route.
+    """
+    # type -> (resource, read method, what the method takes)
+    PART_TYPES = {
+        'custom_user': (CustomUserResource, 'read_custom_user', 'id'),
+        'store': (StoreResource, 'read_store', 'id'),
+        'stores': (StoreResource, 'read_stores', 'params'),
+        'nearby_stores': (StoreResource, 'read_nearby_stores', 'params'),
+        'item': (ItemResource, 'read_item', 'id'),
+        'items': (ItemResource, 'read_items', 'params'),
+    }
+
+    class Meta:
+        resource_name = 'composite'
+        allowed_methods = []
+        authentication = JWTAuthentication()
+        authorization = Authorization()
+        include_resource_uri = False
+        serializer = CompactSerializer()
+
+    def prepend_urls(self):
+        return [
+            url(r"^composite/$", self.wrap_view('composite'), name='composite'),
+        ]
+
+    def part_reader(self, request, part):
+        """
+        Returns a callable that runs ``part`` and returns its response body.
+        """
+        def read():
+            if part.get('type') not in self.PART_TYPES:
+                raise ImmediateHttpResponse(response=HttpBadRequest("Unknown part type."))
+            resource_class, method, argument = self.PART_TYPES[part['type']]
+            resource = resource_class(api_name=self._meta.api_name)
+            if argument == 'id':
+                if part.get('id') is None:
+                    raise ImmediateHttpResponse(response=HttpBadRequest("id is required."))
+                return getattr(resource, method)(request, '%s' % part['id'])
+            params = part.get('params') or {}
+            if not isinstance(params, dict):
+                raise ImmediateHttpResponse(response=HttpBadRequest("params must be an object."))
+            return getattr(resource, method)(request, composite.query_params(params))
+        return read
+
+    def composite(self, request, **kwargs):
+        self.method_check(request, ['post'])
+        self.is_authenticated(request)
+
+        data = self.deserialize(
+            request, request.body, format=request.META.get("CONTENT_TYPE", "application/json")
+        )
+        parts = data.get('parts')
+        if not isinstance(parts, list) or not parts or not all(isinstance(part, dict) for part in parts):
+            raise ImmediateHttpResponse(response=HttpBadRequest("parts must be a list of objects."))
+        if len(parts) > settings.COMPOSITE_MAX_PARTS:
+            raise ImmediateHttpResponse(response=HttpBadRequest(
+                "At most %d parts." % settings.COMPOSITE_MAX_PARTS
+            ))
+        names = [part.get('name') for part in parts]
+        if (not all(isinstance(name, six.string_types) and name for name in names)
+                or len(set(names)) != len(names)):
+            raise ImmediateHttpResponse(response=HttpBadRequest("Every part needs a unique name."))
+
+        results, wall_ms = composite.fan_out([self.part_reader(request, part) for part in parts])
+
+        return self.create_response(
+            request,
+            {
+                'success': True,
+                'data': dict(zip(names, results)),
+                'meta': {'wall_ms': wall_ms}
+            },
+            status=200
+        )
@@ -0,0 +1,69 @@
+"""
+Token revocation.
+
+Every token carries the user's token generation (``gen`` claim) from when
+it was issued. Logging out, changing the password or changing role bumps
+``CustomUser.token_generation``, which invalidates every earlier token.
+
+The generation is checked on every authenticated request, so it is read
+from a per-process dict first, then from the shared cache, and only from
+the database on a miss. Process entries expire after
+``TOKEN_GENERATION_LOCAL_TTL`` seconds, which bounds how long another
+worker can keep accepting a revoked token.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+
+from orders_app.models import CustomUser
+
+# Generation of users that no longer exist; never matches a token.
+MISSING = -1
+
+_local = {}
+
+
+def _cache_key(user_id):
+    return 'token-generation:%s' % user_id
+
+
+def current_generation(user_id):
+    now = time.time()
+    entry = _local.get(user_id)
+    if entry and entry[1] > now:
+        return entry[0]
+
+    generation = cache.get(_cache_key(user_id))
+    if generation is None:
+        generation = CustomUser.objects.filter(user_id=user_id).values_list(
+            'token_generation', flat=True
+        ).first()
+        if generation is None:
+            generation = MISSING
+        cache.set(_cache_key(user_id), generation, settings.TOKEN_GENERATION_CACHE_TTL)
+
+    if len(_local) >= settings.TOKEN_GENERATION_LOCAL_SIZE:
+        _local.clear()
+    _local[user_id] = (generation, now + settings.TOKEN_GENERATION_LOCAL_TTL)
+    return generation
+
+
+def is_revoked(claims):
+    return claims.get('gen', 0) != current_generation(claims['id'])
+
+
+def revoke_tokens(user_id):
+    """
+    Invalidates every token issued to the user so far and returns the new
+    generation, to be put in tokens issued from now on.
+    """
+    CustomUser.objects.filter(user_id=user_id).update(token_generation=F('token_generation') + 1)
+    forget(user_id)
+    return current_generation(user_id)
+
+
+def forget(user_id):
+    cache.delete(_cache_key(user_id))
+    _local.pop(user_id, None)
@@ -0,0 +1,58 @@
+import pkgutil
+
+from tastypie.exceptions import BadRequest
+from tastypie.serializers import Serializer
+
+from orders_app.columnar import pack_columns, unpack_columns
+
+# msgpack is only imported once a client asks for it, see ``_msgpack``.
+HAS_MSGPACK = pkgutil.find_loader('msgpack') is not None
+
+
+def _msgpack():
+    import msgpack
+    return msgpack
+
+
+class CompactSerializer(Serializer):
+    """
+    Adds a MessagePack format (``format=msgpack`` or
+    ``Accept: application/x-msgpack``) for service-to-service consumers.
+
+    Lists of homogeneous objects are sent in columnar form, see
+    ``orders_app.columnar``. ``orders_app.client.decode`` reverses both steps.
+    """
+    formats = Serializer.formats + (['msgpack'] if HAS_MSGPACK else [])
+    content_types = dict(Serializer.content_types, msgpack='application/x-msgpack')
+    columnar = True
+
+    def deserialize(self, content, format='application/json'):
+        # The base class coerces the body to text, which would corrupt a
+        # binary payload.
+        if format.split(';')[0] == self.content_types['msgpack']:
+            return self.from_msgpack(content)
+        return super(CompactSerializer, self).deserialize(content, format=format)
+
+    def to_msgpack(self, data, options=None):
+        """
+        Given some Python data, produces MessagePack output.
+        """
+        options = options or {}
+        data = self.to_simple(data, options)
+        if self.columnar:
+            data = pack_columns(data)
+
+        # Python 2 byte-string keys such as 'data' must go out as msgpack
+        # ``str`` rather than ``bin``; the API never sends binary values.
+        return _msgpack().packb(data, use_bin_type=False)
+
+    def from_msgpack(self, content):
+        """
+        Given some MessagePack data, returns a Python dictionary of the decoded data.
+        """
+        if not HAS_MSGPACK:
+            raise BadRequest('MessagePack is not supported.')
+        try:
+            return unpack_columns(_msgpack().unpackb(content, raw=False))
+        except Exception:
+            raise BadRequest('Request is not valid MessagePack.')
@@ -1,5 +1,95 @@
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
+from django.dispatch import receiver, Signal
 from tastypie.models import create_api_key
 
-models.signals.post_save.connect(create_api_key, sender=User)
\ No newline at end of file
+from orders_app import cache
+from orders_app.models import CustomUser, Store, Item, Tombstone
+from orders_app.revocation import revoke_tokens, forget
+
+# Sent once after a bulk .update() or .bulk_create() of Store or Item rows,
+# which do not send post_save. ``pks`` are the changed rows (None after a
+# bulk insert), ``store_ids`` their stores or None when the caller does not
+# know them.
+rows_updated = Signal(providing_args=['pks', 'store_ids'])
+
+models.signals.post_save.connect(create_api_key, sender=User)
+
+
+# Tokens are revoked when the password or the role changes. The stored
+# value is compared in pre_save; the bump happens once the row is saved.
+@receiver(models.signals.pre_save, sender=User)
+def track_password_change(sender, instance, update_fields=None, **kwargs):
+    instance._revoke_tokens = False
+    if instance.pk is None or (update_fields is not None and 'password' not in update_fields):
+        return
+    stored = User.objects.filter(pk=instance.pk).values_list('password', flat=True).first()
+    instance._revoke_tokens = stored is not None and stored != instance.password
+
+
+@receiver(models.signals.pre_save, sender=CustomUser)
+def track_role_change(sender, instance, update_fields=None, **kwargs):
+    instance._revoke_tokens = False
+    if instance.pk is None or (update_fields is not None and 'role' not in update_fields):
+        return
+    stored = CustomUser.objects.filter(pk=instance.pk).values_list('role', flat=True).first()
+    instance._revoke_tokens = stored is not None and stored != instance.role
+
+
+@receiver(models.signals.post_save, sender=User)
+@receiver(models.signals.post_save, sender=CustomUser)
+def revoke_on_change(sender, instance, **kwargs):
+    if getattr(instance, '_revoke_tokens', False):
+        instance._revoke_tokens = False
+        user_id = instance.pk if sender is User else instance.user_id
+        generation = revoke_tokens(user_id)
+        if sender is CustomUser:
+            instance.token_generation = generation
+
+
+@receiver(models.signals.post_delete, sender=CustomUser)
+def forget_deleted_user(sender, instance, **kwargs):
+    forget(instance.user_id)
+
+
+# Deletions are recorded for the change feed, see orders_app.changes
+@receiver(models.signals.post_delete, sender=Store)
+@receiver(models.signals.post_delete, sender=Item)
+def record_tombstone(sender, instance, **kwargs):
+    Tombstone.objects.create(model=sender._meta.model_name, object_id=instance.pk)
+
+
+# Cached reads and facets, see orders_app.cache. Versions are bumped once
+# the transaction commits: a bump inside it would let a concurrent read
+# cache the rows as they were before the commit under the new version.
+@receiver(models.signals.post_save, sender=Store)
+@receiver(models.signals.post_delete, sender=Store)
+def invalidate_store(sender, instance, **kwargs):
+    pks = [instance.pk]
+    transaction.on_commit(lambda: cache.invalidate_stores(pks))
+
+
+@receiver(models.signals.post_save, sender=Item)
+@receiver(models.signals.post_delete, sender=Item)
+def invalidate_item(sender, instance, **kwargs):
+    pks, store_ids = [instance.pk], [instance.store_id]
+    transaction.on_commit(lambda: cache.invalidate_items(pks, store_ids))
+
+
+@receiver(rows_updated, sender=Store)
+def invalidate_updated_stores(sender, pks=None, **kwargs):
+    transaction.on_commit(lambda: cache.invalidate_stores(pks))
+
+
+@receiver(rows_updated, sender=Item)
+def invalidate_updated_items(sender, pks=None, store_ids=None, **kwargs):
+    transaction.on_commit(lambda: cache.invalidate_items(pks, store_ids))
+
+
+@receiver(models.signals.post_save, sender=User)
+@receiver(models.signals.post_delete, sender=User)
+@receiver(models.signals.post_save, sender=CustomUser)
+@receiver(models.signals.post_delete, sender=CustomUser)
+def invalidate_custom_user(sender, instance, **kwargs):
+    user_id = instance.pk if sender is User else instance.user_id
+    transaction.on_commit(lambda: cache.invalidate_custom_user(user_id))
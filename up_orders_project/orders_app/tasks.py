@@ -0,0 +1,52 @@
+"""
+Job functions run by ``manage.py run_workers``, see ``orders_app.jobs``.
+"""
+from orders_app import provisioning
+from orders_app.jobs import register
+from orders_app.models import Store, Item
+from orders_app.signals import rows_updated
+from orders_app.utils import chunked
+
+
+@register('import_menu')
+def import_menu(store_id, items):
+    store = Store.objects.get(pk=store_id)
+    created = 0
+    for chunk in chunked(items, 500):
+        created += len(Item.objects.bulk_create([
+            Item(
+                name=item['name'],
+                category=item['category'],
+                price=item['price'],
+                store=store,
+                owner_id=store.owner_id
+            )
+            for item in chunk
+        ]))
+    rows_updated.send(sender=Item, pks=None, store_ids=[store.pk])
+    return {'created': created}
+
+
+@register('purge_store')
+def purge_store(store_id, chunk_size=1000):
+    # Deleting in chunks keeps each statement, and the locks it takes, small.
+    deleted = 0
+    while True:
+        item_ids = list(Item.objects.filter(store_id=store_id).values_list('id', flat=True)[:chunk_size])
+        if not item_ids:
+            break
+        deleted += Item.objects.filter(pk__in=item_ids).delete()[0]
+    Store.objects.filter(pk=store_id).delete()
+    return {'deleted_items': deleted}
+
+
+@register('provision_users', sensitive=True)
+def provision_users(users):
+    # The payload holds plain text passwords, hence sensitive.
+    return provisioning.provision(users)
+
+
+@register('noop')
+def noop(**kwargs):
+    # Used by bench_jobs to measure queue overhead.
+    return kwargs
@@ -1,6 +1,871 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from django.test import TestCase
+import itertools
+import json
+import math
+import random
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.hashers import check_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from tastypie.models import ApiKey
+
+from orders_app import cache as read_cache
+from orders_app import client, geo, jobs, pricefeed, provisioning, revocation
+from orders_app.api import v1_api
+from orders_app.bench import seed_catalog
+from orders_app.jobs import enqueue, register
+from orders_app.models import CustomUser, Store, Item, Job
+from orders_app.resources import StoreResource, UserResource
+from orders_app.serializers import CompactSerializer
+
+# Query budget of every API route: the most queries one request may run,
+# with cold caches. A route must also run the same number of queries at
+# both seeded scales, so a budget cannot hide an N+1. Keys are the URL
+# names of the routes, plus variants of a route (filters, facets).
+QUERY_BUDGETS = {
+    'user_signup': 4,
+    'user_login': 2,
+    'user_logout': 3,
+    'user_provision': 4,
+    'get_custom_user': 1,
+    'create_store': 3,
+    'get_stores': 2,
+    'get_stores_filtered': 2,
+    'get_nearby_stores': 3,
+    'get_store_changes': 3,
+    'get_store_detail': 2,
+    'update_store': 2,
+    'delete_store': 5,
+    'create_item': 3,
+    'import_items': 5,
+    'update_prices': 5,
+    'get_items': 2,
+    'get_items_filtered': 2,
+    'get_item_facets': 3,
+    'get_item_changes': 3,
+    'get_item_detail': 2,
+    'update_item': 2,
+    'delete_item': 4,
+    'get_job': 3,
+    'composite': 6,
+}
+
+SCALES = [
+    ('small', dict(merchants=2, stores_per_merchant=2, items_per_store=3)),
+    ('large', dict(merchants=4, stores_per_merchant=5, items_per_store=8)),
+]
+
+counter = itertools.count()
+
+
+def create_user(role):
+    username = 'budget-%s-%d' % (role.lower(), next(counter))
+    user = User.objects.create_user(username, '%s@example.com' % username, 'password')
+    custom_user = CustomUser.objects.create(user=user, name=username, role=role)
+    token = UserResource().generate_token(user_id=user.id, role=role)
+    return custom_user, token
+
+
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    PRICE_FEED_FLUSH_INTERVAL=0,
+    COMPOSITE_MAX_WORKERS=0
+)
+class QueryBudgetTest(TestCase):
+    """
+    Runs every prepend_urls route against seeded data at two scales and
+    checks its query count against QUERY_BUDGETS.
+    """
+
+    def setUp(self):
+        self.merchant, self.token = create_user('Merchant')
+        self.store = Store.objects.create(
+            name='Budget store', address='1 Main Street', merchant=self.merchant, latitude=12.97, longitude=77.59
+        )
+
+    def new_item(self):
+        return Item.objects.create(name='Budget item', category='Starter', price='1.00', store=self.store)
+
+    def routes(self):
+        """
+        Yields ``(name, method, path, body, token)`` for one call of each
+        route. Anything a call needs is created here, outside the count.
+        """
+        n = next(counter)
+        store = self.store
+        item = self.new_item()
+
+        yield ('user_signup', 'post', '/api/v1/user/signup/', {
+            'username': 'budget-signup-%d' % n, 'password': 'password',
+            'role': 'Consumer', 'email': 'signup-%d@example.com' % n
+        }, None)
+        yield ('user_login', 'post', '/api/v1/user/login/', {
+            'username': self.merchant.user.username, 'password': 'password'
+        }, None)
+        _, logout_token = create_user('Consumer')
+        yield ('user_logout', 'post', '/api/v1/user/logout/', {}, logout_token)
+        staff, staff_token = create_user('Consumer')
+        User.objects.filter(pk=staff.user_id).update(is_staff=True)
+        yield ('user_provision', 'post', '/api/v1/user/provision/', {'users': [
+            {'username': 'budget-provision-%d-%d' % (n, i), 'password': 'password',
+             'role': 'Consumer', 'email': 'provision@example.com'}
+            for i in range(3)
+        ]}, staff_token)
+        yield ('get_custom_user', 'get', '/api/v1/custom_user/get/%d/' % self.merchant.user_id, None, self.token)
+
+        yield ('create_store', 'post', '/api/v1/store/create/', {'name': 'New store', 'address': 'Somewhere'}, self.token)
+        yield ('get_stores', 'get', '/api/v1/store/get/many/', None, self.token)
+        yield ('get_stores_filtered', 'get', '/api/v1/store/get/many/?mine=true&name__icontains=store&fields=id,name', None, self.token)
+        yield ('get_nearby_stores', 'get', '/api/v1/store/nearby/?lat=12.9&lng=77.6&radius=50', None, self.token)
+        yield ('get_store_changes', 'get', '/api/v1/store/changes/?limit=1000', None, self.token)
+        yield ('get_store_detail', 'get', '/api/v1/store/get/%d/' % store.pk, None, self.token)
+        yield ('update_store', 'patch', '/api/v1/store/%d/update/' % store.pk, {'name': 'Renamed store'}, self.token)
+        doomed_store = Store.objects.create(name='Doomed', address='Nowhere', merchant=self.merchant)
+        yield ('delete_store', 'delete', '/api/v1/store/%d/delete/' % doomed_store.pk, None, self.token)
+
+        yield ('create_item', 'post', '/api/v1/item/create/', {
+            'name': 'New item', 'category': 'Dessert', 'price': '2.50', 'store_id': store.pk
+        }, self.token)
+        yield ('import_items', 'post', '/api/v1/item/import/', {
+            'store_id': store.pk,
+            'items': [{'name': 'Imported %d-%d' % (n, i), 'category': 'Beverage', 'price': '1.00'} for i in range(3)]
+        }, self.token)
+        yield ('update_prices', 'post', '/api/v1/item/prices/', {
+            'updates': [{'item_id': item.pk, 'price': '4.00'}, {'item_id': item.pk, 'price': '4.50'}]
+        }, self.token)
+        yield ('get_items', 'get', '/api/v1/item/get/many/', None, self.token)
+        yield ('get_items_filtered', 'get', '/api/v1/item/get/many/?store=%d&price__lt=100&fields=id,name,price,store' % store.pk, None, self.token)
+        yield ('get_item_facets', 'get', '/api/v1/item/get/many/?store=%d&facets=true' % store.pk, None, self.token)
+        yield ('get_item_changes', 'get', '/api/v1/item/changes/?limit=1000', None, self.token)
+        yield ('get_item_detail', 'get', '/api/v1/item/get/%d/' % item.pk, None, self.token)
+        yield ('update_item', 'patch', '/api/v1/item/%d/update/' % item.pk, {'price': '3.00'}, self.token)
+        doomed_item = self.new_item()
+        yield ('delete_item', 'delete', '/api/v1/item/%d/delete/' % doomed_item.pk, None, self.token)
+
+        job = enqueue('noop', {'n': n}, user=self.merchant.user)
+        yield ('get_job', 'get', '/api/v1/job/get/%d/' % job.pk, None, self.token)
+
+        yield ('composite', 'post', '/api/v1/composite/', {'parts': [
+            {'name': 'me', 'type': 'custom_user', 'id': self.merchant.user_id},
+            {'name': 'store', 'type': 'store', 'id': store.pk},
+            {'name': 'menu', 'type': 'items', 'params': {'store': store.pk, 'fields': ['id', 'name', 'price']}},
+            {'name': 'near', 'type': 'nearby_stores', 'params': {'lat': 12.9, 'lng': 77.6, 'radius': 50}},
+        ]}, self.token)
+
+    def measure(self):
+        counts = {}
+        for name, method, path, body, token in self.routes():
+            kwargs = {}
+            if token:
+                kwargs['HTTP_AUTHORIZATION'] = token
+            if body is not None:
+                kwargs['data'] = json.dumps(body)
+                kwargs['content_type'] = 'application/json'
+
+            cache.clear()
+            read_cache.clear_local()
+            revocation._local.clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = getattr(self.client, method)(path, **kwargs)
+            self.assertLess(response.status_code, 300, '%s returned %d: %s' % (
+                name, response.status_code, response.content[:200]
+            ))
+            counts[name] = (len(queries), [query['sql'] for query in queries])
+        return counts
+
+    def test_routes_are_covered(self):
+        url_names = set(
+            pattern.name for resource in v1_api._registry.values() for pattern in resource.prepend_urls()
+        )
+        self.assertEqual(url_names - set(QUERY_BUDGETS), set(), 'API routes without a query budget')
+        self.assertEqual(set(QUERY_BUDGETS), set(name for name, _, _, _, _ in self.routes()))
+
+    def test_query_budgets(self):
+        results = []
+        for scale, sizes in SCALES:
+            seed_catalog(prefix=scale, **sizes)
+            results.append((scale, self.measure()))
+
+        for name, budget in sorted(QUERY_BUDGETS.items()):
+            for scale, counts in results:
+                count, queries = counts[name]
+                self.assertLessEqual(count, budget, '%s ran %d queries at %s scale, budget is %d:\n%s' % (
+                    name, count, scale, budget, '\n'.join(queries)
+                ))
+            (small, small_counts), (large, large_counts) = results
+            self.assertEqual(small_counts[name][0], large_counts[name][0], '%s grows with N: %d -> %d queries' % (
+                name, small_counts[name][0], large_counts[name][0]
+            ))
+
+
+class MessagePackTest(TestCase):
+    """
+    MessagePack responses, columnar lists included, decode with
+    orders_app.client.decode to what the JSON responses carry.
+    """
+
+    def test_round_trip(self):
+        data = {
+            'same_keys': [{'id': 1, 'name': 'a', 'tags': [{'k': 1}, {'k': 2}]}, {'id': 2, 'name': 'b', 'tags': []}],
+            'other_keys': [{'id': 1, 'name': 'a'}, {'id': 2, 'price': '1.00'}],
+            'nested': [[1, [2, 3]], [], [{'a': None}, {'a': [{'b': 1}, {'b': 2}]}]],
+            'one': [{'id': 1}],
+            'empty': {},
+        }
+        packed = CompactSerializer().to_msgpack(data)
+        self.assertEqual(client.decode(packed, 'application/x-msgpack'), data)
+
+    def test_responses(self):
+        merchant, token = create_user('Merchant')
+        for i in range(3):
+            store = Store.objects.create(name='Store %d' % i, address='Street %d' % i, merchant=merchant)
+            Item.objects.create(name='Item %d' % i, category='Dessert', price='2.50', store=store)
+
+        for path in [
+            '/api/v1/store/get/many/',
+            '/api/v1/store/get/%d/' % store.pk,
+            '/api/v1/item/get/many/?facets=true',
+            '/api/v1/item/get/many/?fields=id,name,store',
+        ]:
+            expected = json.loads(self.client.get(path, HTTP_AUTHORIZATION=token).content.decode('utf-8'))
+            for response in [
+                self.client.get(path, HTTP_AUTHORIZATION=token, HTTP_ACCEPT='application/x-msgpack'),
+                self.client.get(path + ('&' if '?' in path else '?') + 'format=msgpack', HTTP_AUTHORIZATION=token),
+            ]:
+                self.assertEqual(response['Content-Type'].split(';')[0], 'application/x-msgpack', path)
+                self.assertEqual(client.decode(response.content, response['Content-Type']), expected, path)
+
+
+@register('always_fails')
+def always_fails():
+    raise ValueError('failed')
+
+
+@register('sleeps')
+def sleeps(seconds):
+    time.sleep(seconds)
+
+
+@override_settings(JOB_RETRY_BACKOFF=5, JOB_MAX_BACKOFF=3600)
+class JobTest(TestCase):
+    """
+    Identical pending jobs are queued once, workers claim due jobs by
+    priority, and failed jobs are retried with backoff until they give up.
+    """
+
+    def setUp(self):
+        jobs.load_tasks()
+
+    def make_due(self, job):
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now() - timedelta(seconds=1))
+
+    def test_dedupe(self):
+        job = enqueue('noop', {'n': 1})
+        self.assertEqual(enqueue('noop', {'n': 1}).pk, job.pk)
+        self.assertNotEqual(enqueue('noop', {'n': 2}).pk, job.pk)
+
+        jobs.run(jobs.claim())
+        self.assertNotEqual(enqueue('noop', {'n': 1}).pk, job.pk)
+
+    def test_claim(self):
+        low = enqueue('noop', {'n': 'low'})
+        high = enqueue('noop', {'n': 'high'}, priority=5)
+        enqueue('noop', {'n': 'later'}, priority=9, run_at=timezone.now() + timedelta(hours=1))
+
+        claimed = jobs.claim()
+        self.assertEqual((claimed.pk, claimed.status, claimed.attempts), (high.pk, Job.RUNNING, 1))
+        self.assertEqual(jobs.claim().pk, low.pk)
+        self.assertIsNone(jobs.claim())
+
+    def test_retry_with_backoff(self):
+        job = enqueue('always_fails', max_attempts=3)
+        for attempt, delay in [(1, 5), (2, 10)]:
+            before = timezone.now()
+            job = jobs.run(jobs.claim())
+            self.assertEqual((job.status, job.attempts), (Job.PENDING, attempt))
+            self.assertGreaterEqual(job.run_at, before + timedelta(seconds=delay))
+            self.assertLess(job.run_at, before + timedelta(seconds=delay + 5))
+            self.assertIsNone(jobs.claim())
+            self.make_due(job)
+
+        job = jobs.run(jobs.claim())
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 3))
+        self.assertIn('ValueError: failed', job.error)
+        self.assertIsNone(jobs.claim())
+
+    def test_requeue_stale(self):
+        long_running = enqueue('noop', {'n': 'long'})
+        lost = enqueue('noop', {'n': 'lost'})
+        jobs.claim(), jobs.claim()
+        started = timezone.now() - timedelta(hours=1)
+        Job.objects.filter(pk=long_running.pk).update(started_at=started, heartbeat_at=timezone.now())
+        Job.objects.filter(pk=lost.pk).update(started_at=started, heartbeat_at=started)
+
+        self.assertEqual(jobs.requeue_stale(), 1)
+        self.assertEqual(Job.objects.get(pk=long_running.pk).status, Job.RUNNING)
+        self.assertEqual(Job.objects.get(pk=lost.pk).status, Job.PENDING)
+
+    def test_import_validates_prices(self):
+        merchant, token = create_user('Merchant')
+        store = Store.objects.create(name='Import store', address='1 Main Street', merchant=merchant)
+        response = self.client.post('/api/v1/item/import/', json.dumps({'store_id': store.pk, 'items': [
+            {'name': 'Tea', 'category': 'Beverage', 'price': '1.00'},
+            {'name': 'Coffee', 'category': 'Beverage', 'price': 'abc'},
+        ]}), content_type='application/json', HTTP_AUTHORIZATION=token)
+        self.assertEqual((response.status_code, response.content), (400, b'Invalid item at index 1.'))
+        self.assertFalse(Job.objects.exists())
+
+
+@override_settings(JOB_HEARTBEAT_INTERVAL=0.05)
+class JobHeartbeatTest(TransactionTestCase):
+    """
+    A running job's heartbeat is bumped from another thread until it ends.
+    """
+
+    def test_heartbeat(self):
+        jobs.load_tasks()
+        enqueue('sleeps', {'seconds': 0.3})
+        job = jobs.run(jobs.claim())
+        self.assertEqual(job.status, Job.DONE)
+        job.refresh_from_db()
+        self.assertGreater(job.heartbeat_at, job.started_at + timedelta(seconds=0.1))
+
+
+class AdminKeysetTest(TestCase):
+    """
+    Keyset changelist pages report the rows shown and do not offer
+    select-across, which would act on every older row.
+    """
+
+    def setUp(self):
+        merchant, _ = create_user('Merchant')
+        Store.objects.bulk_create([
+            Store(name='Store %d' % i, address='Street %d' % i, merchant=merchant, owner_id=merchant.user_id)
+            for i in range(60)
+        ])
+        self.client.force_login(User.objects.create_superuser('keyset-admin', 'admin@example.com', 'password'))
+        self.after = Store.objects.order_by('-pk')[0].pk + 1
+
+    def test_result_count(self):
+        response = self.client.get('/admin/orders_app/store/?after=%d' % self.after)
+        self.assertEqual(response.context['cl'].result_count, 50)
+        self.assertNotContains(response, 'Select all')
+
+    def test_select_across(self):
+        newest = Store.objects.order_by('-pk')[0].pk
+        self.client.post('/admin/orders_app/store/?after=%d' % self.after, {
+            'action': 'delete_selected', 'select_across': '1', 'index': '0',
+            '_selected_action': [newest], 'post': 'yes',
+        })
+        self.assertEqual(Store.objects.count(), 59)
+        self.assertFalse(Store.objects.filter(pk=newest).exists())
+
+
+class GeoCellRangesTest(TestCase):
+    """
+    cell_ranges covers every point within the radius, checked by brute
+    force against distance_km around the antimeridian and the poles.
+    """
+
+    def destination(self, lat, lng, bearing, distance):
+        # Point ``distance`` km from (lat, lng) along ``bearing`` degrees.
+        angle = distance / geo.EARTH_RADIUS_KM
+        lat1, lng1, bearing = math.radians(lat), math.radians(lng), math.radians(bearing)
+        lat2 = math.asin(math.sin(lat1) * math.cos(angle) + math.cos(lat1) * math.sin(angle) * math.cos(bearing))
+        lng2 = lng1 + math.atan2(
+            math.sin(bearing) * math.sin(angle) * math.cos(lat1),
+            math.cos(angle) - math.sin(lat1) * math.sin(lat2)
+        )
+        return math.degrees(lat2), (math.degrees(lng2) + 540) % 360 - 180
+
+    def test_brute_force(self):
+        rng = random.Random(0)
+        centers = [
+            (0, 179.99), (0, -180), (45.5, 180), (-33.9, -179.97),
+            (89.99, 10), (89.6, 179.9), (-89.95, -45), (-89.7, -179.99), (90, 0),
+        ]
+        for lat, lng in centers:
+            for radius in (1, 10, geo.MAX_RADIUS_KM):
+                ranges = geo.cell_ranges(lat, lng, radius)
+                points = [self.destination(lat, lng, bearing, radius * 0.999) for bearing in range(0, 360, 2)]
+                points += [
+                    self.destination(lat, lng, rng.uniform(0, 360), radius * math.sqrt(rng.random()))
+                    for _ in range(500)
+                ]
+                # Points sampled on a grid, kept if distance_km puts them inside.
+                delta_lat = math.degrees(radius / geo.EARTH_RADIUS_KM) + geo.CELL_DEGREES
+                delta_lng = min(180, delta_lat / max(math.cos(math.radians(min(89.9, abs(lat) + delta_lat))), 1e-6))
+                for i in range(41):
+                    point_lat = max(-90, min(90, lat - delta_lat + 2 * delta_lat * i / 40))
+                    for j in range(121):
+                        point_lng = (lng - delta_lng + 2 * delta_lng * j / 120 + 540) % 360 - 180
+                        if geo.distance_km(lat, lng, point_lat, point_lng) <= radius:
+                            points.append((point_lat, point_lng))
+                for point_lat, point_lng in points:
+                    self.assertLessEqual(geo.distance_km(lat, lng, point_lat, point_lng), radius)
+                    cell = geo.grid_cell(point_lat, point_lng)
+                    self.assertTrue(
+                        any(first <= cell <= last for first, last in ranges),
+                        (lat, lng, radius, point_lat, point_lng)
+                    )
+
+
+class RevocationTest(TestCase):
+    """
+    Logging out, changing the password and changing role each revoke the
+    tokens issued before.
+    """
+
+    def setUp(self):
+        cache.clear()
+        revocation._local.clear()
+        self.merchant, self.token = create_user('Merchant')
+
+    def status(self, token):
+        return self.client.get('/api/v1/store/get/many/', HTTP_AUTHORIZATION=token).status_code
+
+    def test_logout(self):
+        self.assertEqual(self.status(self.token), 200)
+        self.client.post('/api/v1/user/logout/', '{}', content_type='application/json', HTTP_AUTHORIZATION=self.token)
+        self.assertEqual(self.status(self.token), 401)
+
+    def test_password_change(self):
+        self.assertEqual(self.status(self.token), 200)
+        user = self.merchant.user
+        user.set_password('changed')
+        user.save()
+        self.assertEqual(self.status(self.token), 401)
+
+        response = self.client.post('/api/v1/user/login/', json.dumps({
+            'username': user.username, 'password': 'changed'
+        }), content_type='application/json')
+        self.assertEqual(self.status(json.loads(response.content.decode('utf-8'))['access_token']), 200)
+
+    def test_role_change(self):
+        self.assertEqual(self.status(self.token), 200)
+        self.merchant.role = 'Consumer'
+        self.merchant.save()
+        self.assertEqual(self.status(self.token), 401)
+
+
+@override_settings(CHANGE_FEED_DELAY=0)
+class ChangeFeedTest(TestCase):
+    """
+    Paging through the change feed returns every update and deletion once,
+    and holds back changes younger than CHANGE_FEED_DELAY.
+    """
+
+    def setUp(self):
+        self.merchant, self.token = create_user('Merchant')
+        self.stores = [
+            Store.objects.create(name='Store %d' % i, address='Somewhere', merchant=self.merchant)
+            for i in range(5)
+        ]
+
+    def changes(self, since='', limit=2):
+        response = self.client.get(
+            '/api/v1/store/changes/', {'since': since, 'limit': limit}, HTTP_AUTHORIZATION=self.token
+        )
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content.decode('utf-8'))['data']
+
+    def sync(self, since=''):
+        updated, deleted = [], []
+        while True:
+            page = self.changes(since)
+            updated.extend(store['id'] for store in page['updated'])
+            deleted.extend(page['deleted'])
+            since = page['next']
+            if not page['has_more']:
+                return updated, deleted, since
+
+    def test_paging(self):
+        # Rows stamped with the same time are ordered by id.
+        Store.objects.filter(pk__in=[store.pk for store in self.stores[:3]]).update(
+            updated_at=timezone.now() - timedelta(seconds=1)
+        )
+        updated, deleted, since = self.sync()
+        self.assertEqual(sorted(updated), sorted(store.pk for store in self.stores))
+        self.assertEqual((len(updated), deleted), (5, []))
+
+        self.stores[1].name = 'Renamed'
+        self.stores[1].save()
+        deleted_pk = self.stores[2].pk
+        self.stores[2].delete()
+        updated, deleted, since = self.sync(since)
+        self.assertEqual((updated, deleted), ([self.stores[1].pk], [deleted_pk]))
+        self.assertEqual(self.sync(since), ([], [], since))
+
+    def test_recent_changes_are_held_back(self):
+        _, _, since = self.sync()
+        self.stores[0].save()
+        with self.settings(CHANGE_FEED_DELAY=60):
+            self.assertEqual(self.sync(since), ([], [], since))
+        self.assertEqual(self.sync(since)[0], [self.stores[0].pk])
+
+
+class PartialUpdateTest(TestCase):
+    """
+    Partial updates validate the fields they are given.
+    """
+
+    def setUp(self):
+        self.merchant, self.token = create_user('Merchant')
+        self.store = Store.objects.create(name='Store', address='1 Main Street', merchant=self.merchant)
+        self.item = Item.objects.create(name='Tea', category='Beverage', price='1.00', store=self.store)
+
+    def patch(self, path, body):
+        return self.client.patch(
+            path, json.dumps(body), content_type='application/json', HTTP_AUTHORIZATION=self.token
+        )
+
+    def test_invalid_values(self):
+        store_path = '/api/v1/store/%d/update/' % self.store.pk
+        item_path = '/api/v1/item/%d/update/' % self.item.pk
+        for path, body in [
+            (store_path, {'name': None}),
+            (store_path, {'name': 'x' * 151}),
+            (item_path, {'name': ''}),
+        ]:
+            self.assertEqual(self.patch(path, body).status_code, 400, body)
+        self.assertEqual(Store.objects.get(pk=self.store.pk).name, 'Store')
+        self.assertEqual(Item.objects.get(pk=self.item.pk).name, 'Tea')
+
+        self.assertEqual(self.patch(store_path, {'name': 'Renamed'}).status_code, 200)
+        self.assertEqual(Store.objects.get(pk=self.store.pk).name, 'Renamed')
+
+
+class PriceFeedTest(TestCase):
+    """
+    Prices for other merchants' items are skipped when submitted, and a
+    flush never overwrites a price submitted later.
+    """
+
+    def setUp(self):
+        self.merchant, self.token = create_user('Merchant')
+        store = Store.objects.create(name='Feed store', address='1 Main Street', merchant=self.merchant)
+        self.item = Item.objects.create(name='Tea', category='Beverage', price='1.00', store=store)
+
+    def price(self):
+        return Item.objects.get(pk=self.item.pk).price
+
+    @override_settings(PRICE_FEED_FLUSH_INTERVAL=3600)
+    def test_other_merchants_are_skipped(self):
+        other, _ = create_user('Merchant')
+        self.assertEqual(pricefeed.submit([(self.item.pk, Decimal('5.00'))], self.merchant.user_id), [])
+        self.assertEqual(pricefeed.submit([(self.item.pk, Decimal('9.00'))], other.user_id), [self.item.pk])
+        timer = pricefeed._timer
+        self.assertEqual(pricefeed.flush(), 1)
+        timer.cancel()
+        self.assertEqual(self.price(), Decimal('5.00'))
+
+    def test_later_submission_wins(self):
+        # Two processes buffered prices; the later submission is flushed first.
+        earlier = timezone.now()
+        later = earlier + timedelta(seconds=1)
+        pricefeed._pending[self.item.pk] = (Decimal('7.00'), later, self.item.store_id)
+        self.assertEqual(pricefeed.flush(), 1)
+        pricefeed._pending[self.item.pk] = (Decimal('6.00'), earlier, self.item.store_id)
+        self.assertEqual(pricefeed.flush(), 0)
+        self.assertEqual(self.price(), Decimal('7.00'))
+
+
+class ReadCacheTest(TransactionTestCase):
+    """
+    Cached reads are served without queries, invalidated by writes once
+    they commit, and a burst of misses runs the loader once.
+    """
+
+    def setUp(self):
+        cache.clear()
+        read_cache.clear_local()
+        revocation._local.clear()
+        self.merchant, self.token = create_user('Merchant')
+        self.store = Store.objects.create(name='Cached store', address='1 Main Street', merchant=self.merchant)
+
+    def get_store(self, pk=None):
+        path = '/api/v1/store/get/%s/' % (pk or self.store.pk)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path, HTTP_AUTHORIZATION=self.token)
+        return len(queries), json.loads(response.content.decode('utf-8'))['data']
+
+    def test_reads_are_cached_until_a_write(self):
+        _, data = self.get_store()
+        self.assertEqual(self.get_store(), (0, data))
+
+        self.client.patch(
+            '/api/v1/store/%d/update/' % self.store.pk, json.dumps({'name': 'Renamed'}),
+            content_type='application/json', HTTP_AUTHORIZATION=self.token
+        )
+        count, data = self.get_store()
+        self.assertEqual((count, data['name']), (1, 'Renamed'))
+
+    def test_bump_after_commit(self):
+        scopes = read_cache.store_scopes(self.store.pk)
+        before = read_cache.versions(scopes)
+        with transaction.atomic():
+            self.store.name = 'Renamed'
+            self.store.save()
+            self.assertEqual(read_cache.versions(scopes), before)
+        self.assertNotEqual(read_cache.versions(scopes), before)
+
+    def test_lists_are_paged(self):
+        for i in range(24):
+            Store.objects.create(name='Store %d' % i, address='Street %d' % i, merchant=self.merchant)
+
+        def page(query):
+            response = self.client.get('/api/v1/store/get/many/' + query, HTTP_AUTHORIZATION=self.token)
+            if response.status_code != 200:
+                return response.status_code
+            body = json.loads(response.content.decode('utf-8'))
+            return [store['id'] for store in body['data']], body['meta']['has_more']
+
+        first, has_more = page('')
+        self.assertEqual((len(first), has_more), (20, True))
+        second, has_more = page('?offset=20')
+        self.assertEqual((len(second), has_more), (5, False))
+        self.assertEqual(first + second, sorted(Store.objects.values_list('pk', flat=True)))
+        self.assertEqual(page('?limit=100')[0], first + second)
+        self.assertEqual([page('?limit=101'), page('?offset=-1'), page('?limit=abc')], [400, 400, 400])
+
+    def test_ids_are_normalized(self):
+        padded = '0%d' % self.store.pk
+        self.get_store(padded)
+        self.client.patch(
+            '/api/v1/store/%d/update/' % self.store.pk, json.dumps({'name': 'Renamed'}),
+            content_type='application/json', HTTP_AUTHORIZATION=self.token
+        )
+        self.assertEqual(self.get_store(padded)[1]['name'], 'Renamed')
+
+        response = self.client.get('/api/v1/store/get/abc/', HTTP_AUTHORIZATION=self.token)
+        self.assertEqual(response.status_code, 404)
+
+    def test_concurrent_misses_load_once(self):
+        calls = []
+        started = threading.Event()
+
+        def load():
+            calls.append(1)
+            started.set()
+            time.sleep(0.2)
+            return 'value'
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(read_cache.read_through('test', ['test'], (), load)))
+            for _ in range(5)
+        ]
+        threads[0].start()
+        started.wait(1)
+        for thread in threads[1:]:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual((len(calls), results), (1, ['value'] * 5))
+
+
+@override_settings(COMPOSITE_MAX_WORKERS=4)
+class FacetTest(TransactionTestCase):
+    """
+    Facet counts follow the filters, and a write to one store's items
+    refreshes that store's cached facets only. Invalidation runs on commit,
+    hence a TransactionTestCase.
+    """
+
+    def setUp(self):
+        cache.clear()
+        read_cache.clear_local()
+        revocation._local.clear()
+        self.merchant, self.token = create_user('Merchant')
+        self.store = Store.objects.create(name='Facet store', address='1 Main Street', merchant=self.merchant)
+        self.other = Store.objects.create(name='Other store', address='2 Main Street', merchant=self.merchant)
+        self.cake = Item.objects.create(name='Cake', category='Dessert', price=300, store=self.store)
+        Item.objects.create(name='Cookie', category='Dessert', price=50, store=self.store)
+        Item.objects.create(name='Juice', category='Beverage', price=120, store=self.store)
+        Item.objects.create(name='Pie', category='Dessert', price=80, store=self.other)
+
+    def facets(self, query):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/v1/item/get/many/?facets=true&' + query, HTTP_AUTHORIZATION=self.token)
+        facets = json.loads(response.content.decode('utf-8'))['facets']
+        prices = dict((bucket['label'], bucket['count']) for bucket in facets['price'] if bucket['count'])
+        categories = dict((name, count) for name, count in facets['category'].items() if count)
+        return len(queries), categories, prices
+
+    def test_counts_follow_writes(self):
+        store_query = 'store=%d&price__gte=100' % self.store.pk
+        other_query = 'store=%d' % self.other.pk
+        self.assertEqual(self.facets(store_query)[1:], (
+            {'Dessert': 1, 'Beverage': 1}, {'100-250': 1, '250-500': 1}
+        ))
+        other = self.facets(other_query)
+        self.assertEqual(other[1:], ({'Dessert': 1}, {'0-100': 1}))
+
+        Item.objects.create(name='Tart', category='Dessert', price=150, store=self.store)
+        self.assertEqual(self.facets(store_query)[1:], (
+            {'Dessert': 2, 'Beverage': 1}, {'100-250': 2, '250-500': 1}
+        ))
+        self.cake.price = 600
+        self.cake.save()
+        self.assertEqual(self.facets(store_query)[1:], (
+            {'Dessert': 2, 'Beverage': 1}, {'100-250': 2, '500-1000': 1}
+        ))
+
+        # The other store's listing and facets are still cached.
+        self.assertEqual(self.facets(other_query), (0,) + other[1:])
+
+
+class CompositeThreadsTest(TransactionTestCase):
+    """
+    Composite parts run on the thread pool, and a failing part does not
+    fail the others. Pool threads use their own connections, so the data
+    is committed.
+    """
+
+    def setUp(self):
+        cache.clear()
+        read_cache.clear_local()
+        revocation._local.clear()
+        self.merchant, self.token = create_user('Merchant')
+        self.store = Store.objects.create(name='Pooled store', address='1 Main Street', merchant=self.merchant)
+
+    def test_parts_fail_independently(self):
+        threads = set()
+        read_store = StoreResource.__dict__['read_store']
+
+        def recording_read_store(resource, request, pk):
+            threads.add(threading.current_thread().name)
+            if pk == '-1':
+                raise RuntimeError('broken')
+            return read_store(resource, request, pk)
+
+        parts = [
+            {'name': 'store', 'type': 'store', 'id': self.store.pk},
+            {'name': 'same', 'type': 'store', 'id': self.store.pk},
+            {'name': 'missing', 'type': 'store', 'id': self.store.pk + 1000},
+            {'name': 'unknown', 'type': 'unknown'},
+            {'name': 'broken', 'type': 'store', 'id': -1},
+            {'name': 'invalid', 'type': 'items', 'params': {'price__lt': 'x'}},
+            {'name': 'menu', 'type': 'items', 'params': {'store': self.store.pk}},
+        ]
+        StoreResource.read_store = recording_read_store
+        try:
+            response = self.client.post(
+                '/api/v1/composite/', json.dumps({'parts': parts}),
+                content_type='application/json', HTTP_AUTHORIZATION=self.token
+            )
+        finally:
+            StoreResource.read_store = read_store
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content.decode('utf-8'))['data']
+        self.assertEqual(
+            dict((name, part['status']) for name, part in data.items()),
+            {'store': 200, 'same': 200, 'missing': 404, 'unknown': 400, 'broken': 500, 'invalid': 400, 'menu': 200}
+        )
+        self.assertEqual(data['store']['data']['name'], 'Pooled store')
+        self.assertEqual(data['menu']['data'], [])
+        self.assertNotIn(threading.current_thread().name, threads)
+
+    def test_part_names(self):
+        for name in [None, '', 1, ['a'], {'a': 1}]:
+            response = self.client.post(
+                '/api/v1/composite/', json.dumps({'parts': [{'name': name, 'type': 'store', 'id': self.store.pk}]}),
+                content_type='application/json', HTTP_AUTHORIZATION=self.token
+            )
+            self.assertEqual(response.status_code, 400, name)
+
+
+class ProvisioningTest(TestCase):
+    """
+    Bulk provisioning creates users that can log in, each with an API key
+    and a custom user, and skips the users it cannot create.
+    """
+
+    def test_provision(self):
+        create_user('Consumer')
+        taken = User.objects.latest('pk').username
+        users = [
+            {'username': 'provisioned-%d' % i, 'password': 'secret-%d' % i, 'email': 'p%d@example.com' % i,
+             'role': 'Merchant' if i % 2 else 'Consumer'}
+            for i in range(5)
+        ] + [
+            {'username': 'provisioned-0', 'password': 'x', 'email': 'p@example.com', 'role': 'Consumer'},
+            {'username': taken, 'password': 'x', 'email': 'p@example.com', 'role': 'Consumer'},
+            {'username': 'bad-role', 'password': 'x', 'email': 'p@example.com', 'role': 'Admin'},
+        ]
+
+        report = provisioning.provision(users, processes=1, chunk_size=2)
+
+        self.assertEqual(report['created'], 5)
+        self.assertEqual(sorted(skipped['username'] for skipped in report['skipped']), sorted(['bad-role', 'provisioned-0', taken]))
+        user = User.objects.get(username='provisioned-3')
+        self.assertTrue(user.check_password('secret-3'))
+        self.assertEqual(user.customuser.role, 'Merchant')
+        self.assertEqual(ApiKey.objects.filter(user__username__startswith='provisioned-').count(), 5)
+
+    def test_invalid_types(self):
+        valid = {'username': 'typed', 'password': 'secret', 'email': 'p@example.com', 'role': 'Consumer'}
+        users = [dict(valid, **{field: value}) for field, value in [
+            ('username', 123), ('username', ['typed']), ('password', 123), ('password', ['secret']),
+            ('email', 123), ('email', ['p@example.com']), ('role', ['Consumer']), ('role', {}), ('name', 1),
+        ]] + [valid]
+
+        report = provisioning.provision(users, processes=1)
+
+        self.assertEqual(report['created'], 1)
+        self.assertEqual(len(report['skipped']), 9)
+        self.assertTrue(User.objects.filter(username='typed').exists())
+
+    def test_collision_after_check(self):
+        # As if the username were taken after it was checked.
+        create_user('Consumer')
+        taken = User.objects.latest('pk').username
+        existing_usernames = provisioning.existing_usernames
+        provisioning.existing_usernames = lambda usernames, chunk_size: set()
+        try:
+            report = provisioning.provision([
+                {'username': username, 'password': 'secret', 'email': 'p@example.com', 'role': 'Consumer'}
+                for username in ['first', taken, 'last']
+            ], processes=1)
+        finally:
+            provisioning.existing_usernames = existing_usernames
+
+        self.assertEqual(report['created'], 2)
+        self.assertEqual(report['skipped'], [{'username': taken, 'reason': 'Username already exists'}])
+        self.assertEqual(CustomUser.objects.filter(user__username__in=['first', 'last']).count(), 2)
+
+    def test_process_pool(self):
+        # run_workers runs jobs on threads, so the pool is forked from one.
+        hashes = []
+        worker = threading.Thread(target=lambda: hashes.extend(provisioning.hash_passwords(['a', 'b', 'c'], 2)))
+        worker.start()
+        worker.join()
+        self.assertEqual([check_password(password, hashed) for password, hashed in zip('abc', hashes)], [True] * 3)
+
+        report = provisioning.provision([
+            {'username': 'pooled-%d' % i, 'password': 'secret', 'email': 'p@example.com', 'role': 'Consumer'}
+            for i in range(4)
+        ], processes=2)
+        self.assertEqual(report['created'], 4)
+        self.assertTrue(User.objects.get(username='pooled-3').check_password('secret'))
+
+    def test_admin_hides_payload(self):
+        admin_user = User.objects.create_superuser('provision-admin', 'admin@example.com', 'password')
+        self.client.force_login(admin_user)
+        job = enqueue('provision_users', {'users': [{'username': 'someone', 'password': 'plain-secret'}]})
+        response = self.client.get('/admin/orders_app/job/%d/change/' % job.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(b'plain-secret', response.content)
+
+        job = enqueue('noop', {'shown': 'plain-value'})
+        self.assertIn(b'plain-value', self.client.get('/admin/orders_app/job/%d/change/' % job.pk).content)
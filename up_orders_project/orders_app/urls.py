@@ -1,7 +1,9 @@
 from django.conf.urls import url, include
 
+from orders_app import views
 from orders_app.api import v1_api
 
 urlpatterns = [
-    url(r'^api/', include(v1_api.urls))
-]
\ No newline at end of file
+    url(r'^api/', include(v1_api.urls)),
+    url(r'^stats/cache/$', views.cache_stats, name='cache_stats'),
+]
@@ -0,0 +1,16 @@
+from itertools import islice
+
+
+def chunked(iterable, size):
+    """
+    Yields lists of up to ``size`` items from ``iterable``.
+
+    Used to bound ``bulk_create`` statements without passing ``batch_size``,
+    which would override the backend's own limit (SQLite's 999 variables).
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
@@ -1,6 +1,17 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from django.shortcuts import render
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
+from django.views.decorators.http import require_http_methods
 
-# Create your views here.
+from orders_app import cache
+
+
+# Read cache hit ratio and latency per route, for this process
+@staff_member_required
+@require_http_methods(['GET', 'DELETE'])
+def cache_stats(request):
+    if request.method == 'DELETE':
+        cache.stats.reset()
+    return JsonResponse({'success': True, 'data': cache.stats.snapshot()})
@@ -0,0 +1,81 @@
+"""
+Worker warm-up.
+
+``warm_up`` does the work a fresh process would otherwise do on its first
+request: importing the API and compiling every route regex, opening the
+database connections and priming caches. ``up_orders_project.wsgi`` calls it
+before handing out ``application`` when ``settings.WARM_UP_ON_START`` is set.
+
+Database connections belong to the thread that opens them. The one opened
+here is only reused by servers that handle requests in the thread that
+loaded the application, e.g. uWSGI or gunicorn sync workers without
+``--threads``. Threaded servers (``runserver``, gunicorn ``gthread``) open a
+connection per request thread, so there the ``db`` step only checks that
+the database is reachable.
+
+Do not combine it with servers that load the application in a master
+process before forking (e.g. gunicorn ``--preload``) as the forked workers
+would share the master's database sockets.
+"""
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.urls import get_resolver
+
+_hooks = []
+
+
+def register(hook):
+    """
+    Registers a callable to run as an extra warm-up step. Usable as a decorator.
+    """
+    _hooks.append(hook)
+    return hook
+
+
+def _compile_patterns(patterns):
+    count = 0
+    for pattern in patterns:
+        pattern.regex
+        count += 1
+        if hasattr(pattern, 'url_patterns'):
+            count += _compile_patterns(pattern.url_patterns)
+    return count
+
+
+def resolve_urls():
+    resolver = get_resolver()
+    resolver.reverse_dict
+    return _compile_patterns(resolver.url_patterns)
+
+
+def open_connections():
+    # Connects this thread only; see the module docstring.
+    for alias in connections:
+        connections[alias].ensure_connection()
+
+
+def prime_caches():
+    for alias in settings.CACHES:
+        caches[alias].get('warmup')
+
+
+def warm_up():
+    """
+    Runs every warm-up step and returns the time each took in milliseconds.
+    """
+    steps = [
+        ('urls', resolve_urls),
+        ('db', open_connections),
+        ('caches', prime_caches),
+    ] + [(hook.__name__, hook) for hook in _hooks]
+
+    timings = OrderedDict()
+    for name, step in steps:
+        start = time.time()
+        step()
+        timings[name] = (time.time() - start) * 1000
+    return timings
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/1.11/ref/settings/
 """
 
 import os
+import sys
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -71,6 +72,13 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'up_orders_project.wsgi.application'
 
+# Resolve URLs, connect to the database and prime caches before the WSGI
+# application is handed to the server. The database connection is per
+# thread: it is reused only by servers that run requests in the loading
+# thread (uWSGI, gunicorn sync workers), not by threaded ones such as
+# runserver. See orders_app.warmup.
+WARM_UP_ON_START = True
+
 
 # Database
 # https://docs.djangoproject.com/en/1.11/ref/settings/#databases
@@ -83,11 +91,23 @@ DATABASES = {
         'PASSWORD': 'hakuna_matata',
         'HOST': '127.0.0.1',
         'PORT': '3306',
+        'CONN_MAX_AGE': 60,
         # 'ENGINE': 'django.db.backends.sqlite3',
         # 'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
     }
 }
 
+# The test suite (including the query budgets in orders_app.tests) runs
+# offline against SQLite.
+if 'test' in sys.argv:
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # A file rather than memory, so that threads with their own
+        # connection (the composite pool) see the same database.
+        'TEST': {'NAME': os.path.join(BASE_DIR, 'test_db.sqlite3')},
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
@@ -126,3 +146,105 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/1.11/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# Background jobs (orders_app.jobs, manage.py run_workers)
+
+JOB_WORKER_PROCESSES = 1
+
+JOB_WORKER_THREADS = 4
+
+JOB_POLL_INTERVAL = 1.0
+
+# Seconds before the first retry of a failed job, doubled on every attempt.
+JOB_RETRY_BACKOFF = 5
+
+JOB_MAX_BACKOFF = 3600
+
+# Seconds between heartbeats of a running job, and between checks for
+# stale jobs.
+JOB_HEARTBEAT_INTERVAL = 15
+
+# Running jobs without a heartbeat for this long are assumed lost and put
+# back in the queue. Keep it well above JOB_HEARTBEAT_INTERVAL.
+JOB_STALE_AFTER = 120
+
+
+# Token revocation (orders_app.revocation)
+
+# Seconds a worker may keep using its own copy of a user's token
+# generation, i.e. the longest a revoked token can still be accepted by
+# another worker. This only holds with a cache shared by every worker:
+# with a per-process cache it is TOKEN_GENERATION_CACHE_TTL.
+TOKEN_GENERATION_LOCAL_TTL = 5
+
+TOKEN_GENERATION_LOCAL_SIZE = 100000
+
+TOKEN_GENERATION_CACHE_TTL = 300
+
+# Revocation and read cache invalidation are shared between workers
+# through the default cache, so it must be shared as well. The tests run
+# with a per-process cache.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': os.environ.get('MEMCACHED_LOCATION', '127.0.0.1:11211'),
+    }
+}
+
+if 'test' in sys.argv:
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+
+
+# Change feed (orders_app.changes): seconds a change is held back before
+# it is handed out. Rows are stamped before their transaction commits, so
+# this must exceed the longest write transaction plus the clock skew
+# between servers, or a change can fall behind a client's cursor.
+CHANGE_FEED_DELAY = 10
+
+
+# Price feed (orders_app.pricefeed): seconds price updates are buffered and
+# coalesced before being written. 0 writes every submission immediately.
+PRICE_FEED_FLUSH_INTERVAL = 2
+
+
+# Item facet counts (orders_app.facets): seconds a cached count may live.
+# Counts are invalidated when items change, so this only bounds memory.
+FACET_CACHE_TIMEOUT = 300
+
+
+# Read cache (orders_app.cache) for store, item and custom user reads.
+# Entries live READ_CACHE_TIMEOUT seconds in the default cache and in a
+# per-process LRU of READ_CACHE_LOCAL_SIZE entries. Other workers see an
+# invalidation within READ_CACHE_LOCAL_TTL seconds.
+READ_CACHE_TIMEOUT = 300
+
+READ_CACHE_LOCAL_SIZE = 1000
+
+READ_CACHE_LOCAL_TTL = 5
+
+# Concurrent misses wait up to READ_CACHE_LOCK_WAIT seconds for the one
+# load in progress; a load holds its lease at most READ_CACHE_LOCK_TIMEOUT.
+READ_CACHE_LOCK_WAIT = 2
+
+READ_CACHE_LOCK_TIMEOUT = 10
+
+
+# Composite reads (orders_app.composite): threads per process that run the
+# parts of a composite request, 0 to run them in the request thread, and
+# the most parts one request may ask for.
+COMPOSITE_MAX_WORKERS = 8
+
+COMPOSITE_MAX_PARTS = 20
+
+
+# Bulk user provisioning (orders_app.provisioning): processes that hash
+# passwords, None for one per core; users inserted per transaction; and
+# the most users one user/provision/ request may carry.
+PROVISION_PROCESSES = None
+
+PROVISION_CHUNK_SIZE = 500
+
+PROVISION_MAX_USERS = 10000
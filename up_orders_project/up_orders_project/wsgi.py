@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "up_orders_project.settings")
 
 application = get_wsgi_application()
+
+from django.conf import settings
+
+if settings.WARM_UP_ON_START:
+    from orders_app.warmup import warm_up
+    warm_up()